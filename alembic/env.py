@@ -27,6 +27,8 @@ if database_url.startswith("postgres://"):
 # Alembic needs sync driver, not async
 if "+asyncpg" in database_url:
     database_url = database_url.replace("+asyncpg", "")
+if "+aiosqlite" in database_url:
+    database_url = database_url.replace("+aiosqlite", "")
 
 config.set_main_option("sqlalchemy.url", database_url)
 
@@ -0,0 +1,37 @@
+"""Add indexes for store diagnosis queries
+
+Revision ID: perf001_diagnosis_indexes
+Revises: wp001_add_wordpress_tables
+Create Date: 2026-10-16
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'perf001_diagnosis_indexes'
+down_revision = 'wp001_add_wordpress_tables'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Unresolved issues per store, newest first (partial index on Postgres)
+    op.create_index(
+        'idx_theme_issues_unresolved',
+        'theme_issues',
+        ['store_id', 'is_resolved', sa.text('detected_at DESC')],
+        postgresql_where=sa.text('is_resolved = false'),
+    )
+    # Recently installed apps per store
+    op.create_index(
+        'idx_installed_apps_installed',
+        'installed_apps',
+        ['store_id', sa.text('installed_on DESC')],
+    )
+
+
+def downgrade():
+    op.drop_index('idx_installed_apps_installed', table_name='installed_apps')
+    op.drop_index('idx_theme_issues_unresolved', table_name='theme_issues')
@@ -0,0 +1,30 @@
+"""Add partial index for last clean scan lookups
+
+Revision ID: perf002_clean_scan_index
+Revises: perf001_diagnosis_indexes
+Create Date: 2026-10-16
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'perf002_clean_scan_index'
+down_revision = 'perf001_diagnosis_indexes'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Latest clean (low risk, no CSS issues) scan per store
+    op.create_index(
+        'idx_daily_scans_clean',
+        'daily_scans',
+        ['store_id', sa.text('scan_date DESC')],
+        postgresql_where=sa.text("risk_level = 'low' AND css_issues_found = 0"),
+    )
+
+
+def downgrade():
+    op.drop_index('idx_daily_scans_clean', table_name='daily_scans')
@@ -0,0 +1,43 @@
+"""Add generated last_activity_at column to installed_apps
+
+Revision ID: perf003_app_last_activity
+Revises: perf002_clean_scan_index
+Create Date: 2026-10-16
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'perf003_app_last_activity'
+down_revision = 'perf002_clean_scan_index'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Latest of installed_on / update_detected_at, kept up to date by the database.
+    # SQLite can't ALTER TABLE ADD a STORED column to a table with rows, so there
+    # it's VIRTUAL (computed on read, still indexable); PostgreSQL only has STORED
+    persisted = op.get_bind().dialect.name != 'sqlite'
+    op.add_column('installed_apps', sa.Column(
+        'last_activity_at',
+        sa.DateTime(timezone=True),
+        sa.Computed(
+            "CASE WHEN update_detected_at > installed_on THEN update_detected_at "
+            "ELSE COALESCE(installed_on, update_detected_at) END",
+            persisted=persisted
+        ),
+    ))
+    # Recently active apps per store, newest first
+    op.create_index(
+        'idx_installed_apps_activity',
+        'installed_apps',
+        ['store_id', sa.text('last_activity_at DESC')],
+    )
+
+
+def downgrade():
+    op.drop_index('idx_installed_apps_activity', table_name='installed_apps')
+    op.drop_column('installed_apps', 'last_activity_at')
@@ -0,0 +1,30 @@
+"""Add updated_at to installed_apps and theme_issues
+
+Revision ID: perf004_updated_at
+Revises: perf003_app_last_activity
+Create Date: 2026-10-17
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'perf004_updated_at'
+down_revision = 'perf003_app_last_activity'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Set on insert and bumped on every ORM/Core update (model defaults), so cached
+    # diagnoses notice in-place edits. No server default - SQLite can't ALTER TABLE
+    # ADD a column defaulting to CURRENT_TIMESTAMP - existing rows are backfilled
+    for table in ('installed_apps', 'theme_issues'):
+        op.add_column(table, sa.Column('updated_at', sa.DateTime(timezone=True), nullable=True))
+        op.execute(f"UPDATE {table} SET updated_at = CURRENT_TIMESTAMP")
+
+
+def downgrade():
+    op.drop_column('theme_issues', 'updated_at')
+    op.drop_column('installed_apps', 'updated_at')
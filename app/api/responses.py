@@ -0,0 +1,22 @@
+"""
+Sherlock - API response classes
+"""
+
+from typing import Any
+
+import orjson
+from fastapi.responses import JSONResponse
+
+
+class ORJSONResponse(JSONResponse):
+    """
+    JSON response rendered with orjson (several times faster than stdlib json).
+    Also serializes datetime and numpy values natively, so handlers can return
+    them without converting to strings first.
+    """
+    
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(
+            content,
+            option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+        )
@@ -7,8 +7,9 @@ from fastapi import APIRouter, HTTPException, Depends, Request
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, desc
 from pydantic import BaseModel
-from typing import Optional
+from typing import Literal, Optional
 
+from app.api.responses import ORJSONResponse
 from app.db.database import get_db
 from app.db.models import Store, Diagnosis
 from app.services.diagnosis_service import DiagnosisService
@@ -235,18 +236,21 @@ async def get_scan_report(
 @router.get("/store-diagnosis/{shop}")
 async def get_store_diagnosis(
     shop: str,
+    detail: Literal["summary", "full"] = "full",
     db: AsyncSession = Depends(get_db)
 ):
     """
     Get full diagnosis for a store
     Identifies issues, correlates with recent apps, and provides actions
+    Pass detail=summary for just the status, issue count and top suspect
     """
     from app.services.issue_correlation_service import IssueCorrelationService
     
     service = IssueCorrelationService(db)
-    diagnosis = await service.get_store_diagnosis(shop)
+    diagnosis = await service.get_store_diagnosis(shop, detail)
     
-    return diagnosis
+    # Returned directly so orjson serializes the datetimes (skips jsonable_encoder)
+    return ORJSONResponse(diagnosis)
 
 
 @router.delete("/clear-issues/{shop}")
@@ -4,7 +4,7 @@ Sherlock - Database models
 
 from sqlalchemy import (
     Column, String, Integer, Float, Boolean, DateTime, Text, JSON,
-    ForeignKey, Index
+    ForeignKey, Index, Computed
 )
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
@@ -80,6 +80,15 @@ class InstalledApp(Base):
     installed_on = Column(DateTime(timezone=True), nullable=True)
     last_updated = Column(String(50), nullable=True)  # From app store listing
     update_detected_at = Column(DateTime(timezone=True), nullable=True)  # When Sherlock detected an update
+    # Latest of installed_on / update_detected_at, maintained by the database
+    last_activity_at = Column(
+        DateTime(timezone=True),
+        Computed(
+            "CASE WHEN update_detected_at > installed_on THEN update_detected_at "
+            "ELSE COALESCE(installed_on, update_detected_at) END",
+            persisted=True
+        )
+    )
     
     # Risk indicators
     is_suspect = Column(Boolean, default=False)  # Flagged as potential issue
@@ -98,6 +107,7 @@ class InstalledApp(Base):
     # Timestamps
     first_seen = Column(DateTime(timezone=True), server_default=func.now())
     last_scanned = Column(DateTime(timezone=True), nullable=True)
+    updated_at = Column(DateTime(timezone=True), default=func.now(), onupdate=func.now())
     
     # Relationships
     store = relationship("Store", back_populates="installed_apps")
@@ -105,6 +115,8 @@ class InstalledApp(Base):
     __table_args__ = (
         Index("idx_installed_apps_store", "store_id"),
         Index("idx_installed_apps_suspect", "store_id", "is_suspect"),
+        Index("idx_installed_apps_installed", "store_id", installed_on.desc()),
+        Index("idx_installed_apps_activity", "store_id", last_activity_at.desc()),
     )
 
 
@@ -176,6 +188,7 @@ class ThemeIssue(Base):
     # Timestamps
     detected_at = Column(DateTime(timezone=True), server_default=func.now())
     resolved_at = Column(DateTime(timezone=True), nullable=True)
+    updated_at = Column(DateTime(timezone=True), default=func.now(), onupdate=func.now())
     
     # Relationships
     store = relationship("Store", back_populates="theme_issues")
@@ -183,6 +196,10 @@ class ThemeIssue(Base):
     __table_args__ = (
         Index("idx_theme_issues_store", "store_id"),
         Index("idx_theme_issues_severity", "store_id", "severity"),
+        Index(
+            "idx_theme_issues_unresolved", "store_id", "is_resolved", detected_at.desc(),
+            postgresql_where=(is_resolved == False)
+        ),
     )
 
 
@@ -317,6 +334,10 @@ class DailyScan(Base):
         Index("idx_daily_scans_store", "store_id"),
         Index("idx_daily_scans_date", "store_id", "scan_date"),
         Index("idx_daily_scans_risk", "store_id", "risk_level"),
+        Index(
+            "idx_daily_scans_clean", "store_id", scan_date.desc(),
+            postgresql_where=((risk_level == "low") & (css_issues_found == 0))
+        ),
     )
 
 
@@ -4,9 +4,54 @@ Searches the web for Shopify app reviews, issues, and complaints
 """
 
 import httpx
+import orjson
+from tenacity import (
+    AsyncRetrying,
+    retry_if_exception_type,
+    retry_if_result,
+    stop_after_attempt,
+    wait_exponential_jitter,
+)
 from typing import Optional, Dict, List, Any
-from datetime import datetime
+from datetime import datetime, timezone
 import os
+import time
+
+
+# Query templates for each search type (filled with str.format)
+_Q_REVIEWS = '"{name}" shopify app review OR issue OR problem OR slow OR conflict'
+_Q_REDDIT = 'site:reddit.com "{name}" shopify (issue OR problem OR slow OR broken OR conflict OR review)'
+_Q_CONFLICTS = '"{name}" shopify conflict OR "doesn\'t work with" OR "breaks" OR "incompatible"'
+_Q_ALTERNATIVES = '"{name}" shopify alternative OR "better than" OR "instead of" OR "switched from"'
+_Q_COMBINED = '"{name}" shopify (review OR issue OR problem OR slow OR conflict OR "doesn\'t work" OR alternative OR "better than")'
+
+# Keyword groups used to bucket results of the combined query (first match wins)
+_CATEGORY_KEYWORDS = {
+    "conflicts": ("conflict", "doesn't work", "breaks", "incompatible"),
+    "alternatives": ("alternative", "better than", "instead of", "switched from"),
+    "reviews": (),
+}
+
+
+# Transient statuses worth retrying (rate limited / temporarily unavailable)
+_RETRY_STATUSES = (429, 503)
+_RETRY_MAX_WAIT = 4.0
+_backoff = wait_exponential_jitter(initial=0.5, max=_RETRY_MAX_WAIT)
+
+
+def _retry_wait(retry_state) -> float:
+    """Honor Retry-After when Google sends one, otherwise back off with jitter"""
+    outcome = retry_state.outcome
+    if outcome is not None and not outcome.failed:
+        retry_after = outcome.result().headers.get("Retry-After", "")
+        if retry_after.isdigit():
+            return min(float(retry_after), _RETRY_MAX_WAIT)
+    return _backoff(retry_state)
+
+
+def _now_iso() -> str:
+    """Current UTC time as an ISO string (second precision)"""
+    return datetime.now(timezone.utc).isoformat(timespec="seconds")
 
 
 class GoogleSearchService:
@@ -14,15 +59,47 @@ class GoogleSearchService:
     
     BASE_URL = "https://www.googleapis.com/customsearch/v1"
     
+    # How long to stop calling the API after a 403 (quota exceeded / bad key)
+    QUOTA_BACKOFF_SECONDS = 60
+    
+    # Negative words too generic to report as a specific issue
+    _VAGUE_ISSUE_WORDS = frozenset({'bad', 'worst', 'terrible', 'awful', 'horrible'})
+    
+    # Issues that weigh more heavily in the risk score
+    _HIGH_RISK_ISSUES = frozenset({'conflict', 'broke', 'crash', "doesn't work", 'not working'})
+    
     def __init__(self):
         self.api_key = os.getenv("GOOGLE_API_KEY")
         self.search_engine_id = os.getenv("GOOGLE_SEARCH_ENGINE_ID")
+        # Static part of the request params, shared by every search
+        self._base_params = {
+            "key": self.api_key,
+            "cx": self.search_engine_id,
+            "dateRestrict": "y2",  # Only results from last 2 years
+        }
+        self._configured = bool(self.api_key and self.search_engine_id)
+        self._quota_until = 0.0
+        self.client = None
+    
+    async def _get_client(self) -> httpx.AsyncClient:
+        """Get or create HTTP/2 client (one multiplexed connection to googleapis.com)"""
+        if self.client is None:
+            self.client = httpx.AsyncClient(timeout=15.0, http2=True)
+        return self.client
+    
+    async def close(self):
+        """Close HTTP client"""
+        if self.client:
+            await self.client.aclose()
+            self.client = None
     
     def _is_configured(self) -> bool:
         """Check if API credentials are configured"""
-        return bool(self.api_key and self.search_engine_id)
+        return self._configured
     
-    async def search_app_reviews(self, app_name: str, limit: int = 10) -> Dict[str, Any]:
+    async def search_app_reviews(
+        self, app_name: str, limit: int = 10, fetched_at: Optional[str] = None
+    ) -> Dict[str, Any]:
         """
         Search for reviews and complaints about a Shopify app
         """
@@ -34,9 +111,9 @@ class GoogleSearchService:
             }
         
         # Search query targeting reviews and issues
-        query = f'"{app_name}" shopify app review OR issue OR problem OR slow OR conflict'
+        query = _Q_REVIEWS.format(name=app_name)
         
-        return await self._perform_search(query, app_name, limit)
+        return await self._perform_search(query, app_name, limit, fetched_at=fetched_at)
     async def search_reddit_discussions(self, app_name: str, limit: int = 10) -> Dict[str, Any]:
         """
         Search Reddit discussions about a Shopify app via Google
@@ -51,7 +128,7 @@ class GoogleSearchService:
             }
         
         # Search Reddit specifically for app issues
-        query = f'site:reddit.com "{app_name}" shopify (issue OR problem OR slow OR broken OR conflict OR review)'
+        query = _Q_REDDIT.format(name=app_name)
         
         result = await self._perform_search(query, app_name, limit, search_type="reddit")
         
@@ -84,7 +161,9 @@ class GoogleSearchService:
         except:
             return "unknown"
         
-    async def search_app_conflicts(self, app_name: str, limit: int = 10) -> Dict[str, Any]:
+    async def search_app_conflicts(
+        self, app_name: str, limit: int = 10, fetched_at: Optional[str] = None
+    ) -> Dict[str, Any]:
         """
         Search specifically for app conflicts
         """
@@ -95,9 +174,11 @@ class GoogleSearchService:
                 "app_name": app_name
             }
         
-        query = f'"{app_name}" shopify conflict OR "doesn\'t work with" OR "breaks" OR "incompatible"'
+        query = _Q_CONFLICTS.format(name=app_name)
         
-        return await self._perform_search(query, app_name, limit, search_type="conflicts")
+        return await self._perform_search(
+            query, app_name, limit, search_type="conflicts", fetched_at=fetched_at
+        )
     
     async def search_app_alternatives(self, app_name: str, limit: int = 10) -> Dict[str, Any]:
         """
@@ -110,7 +191,7 @@ class GoogleSearchService:
                 "app_name": app_name
             }
         
-        query = f'"{app_name}" shopify alternative OR "better than" OR "instead of" OR "switched from"'
+        query = _Q_ALTERNATIVES.format(name=app_name)
         
         return await self._perform_search(query, app_name, limit, search_type="alternatives")
     
@@ -119,39 +200,57 @@ class GoogleSearchService:
         query: str, 
         app_name: str, 
         limit: int = 10,
-        search_type: str = "reviews"
+        search_type: str = "reviews",
+        fetched_at: Optional[str] = None
     ) -> Dict[str, Any]:
         """
         Perform the actual Google search
         """
+        # Recent 403 - don't hammer a known-bad key or exhausted quota
+        if time.monotonic() < self._quota_until:
+            return {
+                "success": False,
+                "error": "API quota exceeded or invalid API key",
+                "app_name": app_name
+            }
+        
         params = {
-            "key": self.api_key,
-            "cx": self.search_engine_id,
+            **self._base_params,
             "q": query,
             "num": min(limit, 10),  # Google allows max 10 per request
-            "dateRestrict": "y2",  # Only results from last 2 years
         }
         
         try:
-            async with httpx.AsyncClient(timeout=15.0) as client:
-                response = await client.get(self.BASE_URL, params=params)
-                
-                if response.status_code == 403:
-                    return {
-                        "success": False,
-                        "error": "API quota exceeded or invalid API key",
-                        "app_name": app_name
-                    }
-                
-                if response.status_code != 200:
-                    return {
-                        "success": False,
-                        "error": f"Search failed with status {response.status_code}",
-                        "app_name": app_name
-                    }
-                
-                data = response.json()
-                return self._parse_results(data, app_name, search_type)
+            client = await self._get_client()
+            retrying = AsyncRetrying(
+                stop=stop_after_attempt(3),
+                wait=_retry_wait,
+                retry=(
+                    retry_if_exception_type(httpx.HTTPError)
+                    | retry_if_result(lambda r: r.status_code in _RETRY_STATUSES)
+                ),
+                # Out of attempts: hand back the last response (or re-raise its error)
+                retry_error_callback=lambda state: state.outcome.result(),
+            )
+            response = await retrying(client.get, self.BASE_URL, params=params)
+            
+            if response.status_code == 403:
+                self._quota_until = time.monotonic() + self.QUOTA_BACKOFF_SECONDS
+                return {
+                    "success": False,
+                    "error": "API quota exceeded or invalid API key",
+                    "app_name": app_name
+                }
+            
+            if response.status_code != 200:
+                return {
+                    "success": False,
+                    "error": f"Search failed with status {response.status_code}",
+                    "app_name": app_name
+                }
+            
+            data = orjson.loads(response.content)
+            return self._parse_results(data, app_name, search_type, fetched_at)
                 
         except httpx.TimeoutException:
             return {
@@ -166,15 +265,43 @@ class GoogleSearchService:
                 "app_name": app_name
             }
     
-    def _parse_results(self, data: Dict, app_name: str, search_type: str) -> Dict[str, Any]:
+    def _parse_results(
+        self,
+        data: Dict,
+        app_name: str,
+        search_type: str,
+        fetched_at: Optional[str] = None
+    ) -> Dict[str, Any]:
         """
         Parse Google search results
         """
         items = data.get("items", [])
         search_info = data.get("searchInformation", {})
         
+        # Nothing to analyze - skip sentiment and scoring
+        if not items:
+            return {
+                "success": True,
+                "app_name": app_name,
+                "search_type": search_type,
+                "total_results": int(search_info.get("totalResults", 0)),
+                "results_returned": 0,
+                "results": [],
+                "sources": [],
+                "sentiment": {
+                    "overall": "unknown",
+                    "positive": 0,
+                    "negative": 0,
+                    "neutral": 0,
+                    "total_analyzed": 0,
+                    "common_issues": []
+                },
+                "google_risk_score": 0,
+                "fetched_at": fetched_at or _now_iso()
+            }
+        
         results = []
-        sources = set()
+        sources: Dict[str, None] = {}  # Ordered by first appearance
         
         for item in items:
             result = {
@@ -184,7 +311,7 @@ class GoogleSearchService:
                 "source": self._extract_domain(item.get("link", "")),
             }
             results.append(result)
-            sources.add(result["source"])
+            sources[result["source"]] = None
         
         # Analyze sentiment from snippets
         sentiment_analysis = self._analyze_snippets(results)
@@ -202,7 +329,7 @@ class GoogleSearchService:
             "sources": list(sources),
             "sentiment": sentiment_analysis,
             "google_risk_score": risk_score,
-            "fetched_at": datetime.utcnow().isoformat()
+            "fetched_at": fetched_at or _now_iso()
         }
     
     def _extract_domain(self, url: str) -> str:
@@ -218,6 +345,16 @@ class GoogleSearchService:
         except:
             return "unknown"
     
+    def _classify_result(self, result: Dict) -> str:
+        """
+        Classify a search result as conflicts, alternatives or reviews by keyword
+        """
+        text = (result.get("title", "") + " " + result.get("snippet", "")).lower()
+        for category, keywords in _CATEGORY_KEYWORDS.items():
+            if any(keyword in text for keyword in keywords):
+                return category
+        return "reviews"
+    
     def _analyze_snippets(self, results: List[Dict]) -> Dict[str, Any]:
         """
         Analyze sentiment from search result snippets
@@ -240,18 +377,18 @@ class GoogleSearchService:
         issues_found = []
         
         for result in results:
-            snippet = result.get("snippet", "").lower()
             title = result.get("title", "").lower()
-            combined = f"{title} {snippet}"
+            snippet = result.get("snippet", "").lower()
             
-            pos = sum(1 for word in positive_words if word in combined)
-            neg = sum(1 for word in negative_words if word in combined)
+            pos = sum(1 for word in positive_words if word in title or word in snippet)
+            negative_hits = [word for word in negative_words if word in title or word in snippet]
+            neg = len(negative_hits)
             
             if neg > pos:
                 negative_count += 1
                 # Extract potential issues
-                for word in negative_words:
-                    if word in combined and word not in ['bad', 'worst', 'terrible', 'awful', 'horrible']:
+                for word in negative_hits:
+                    if word not in self._VAGUE_ISSUE_WORDS:
                         issues_found.append(word)
             elif pos > neg:
                 positive_count += 1
@@ -300,49 +437,69 @@ class GoogleSearchService:
         score += int(negative_ratio * 50)  # Up to 50 points from sentiment
         
         # Additional points for specific issues found
-        issues = sentiment.get("common_issues", [])
-        high_risk_issues = ['conflict', 'broke', 'crash', "doesn't work", 'not working']
+        high_risk_issues = self._HIGH_RISK_ISSUES
         
-        for issue_data in issues:
-            issue = issue_data["issue"]
+        for issue_data in sentiment.get("common_issues", []):
             mentions = issue_data["mentions"]
-            if issue in high_risk_issues:
+            if issue_data["issue"] in high_risk_issues:
                 score += min(mentions * 10, 30)  # Up to 30 points for critical issues
             else:
                 score += min(mentions * 5, 20)  # Up to 20 points for other issues
         
         return min(score, 100)
     
-    async def get_combined_app_insights(self, app_name: str) -> Dict[str, Any]:
+    async def get_combined_app_insights(self, app_name: str, per_type: bool = False) -> Dict[str, Any]:
         """
         Get comprehensive insights by combining multiple searches
-        """
-        # Run all searches
-        reviews = await self.search_app_reviews(app_name, limit=10)
-        conflicts = await self.search_app_conflicts(app_name, limit=5)
         
-        if not reviews.get("success"):
-            return reviews
+        By default a single OR'd query is issued and results are classified
+        by keyword locally. Pass per_type=True to run separate review and
+        conflict searches instead (two API calls).
+        """
+        fetched_at = _now_iso()
+        
+        if per_type:
+            reviews = await self.search_app_reviews(app_name, limit=10, fetched_at=fetched_at)
+            if not reviews.get("success"):
+                return reviews
+            conflicts = await self.search_app_conflicts(app_name, limit=5, fetched_at=fetched_at)
+            searches = [reviews, conflicts] if conflicts.get("success") else [reviews]
+        else:
+            if not self._is_configured():
+                return {
+                    "success": False,
+                    "error": "Google Search API not configured",
+                    "app_name": app_name
+                }
+            reviews = await self._perform_search(
+                _Q_COMBINED.format(name=app_name), app_name, limit=10,
+                search_type="combined", fetched_at=fetched_at
+            )
+            if not reviews.get("success"):
+                return reviews
+            searches = [reviews]
         
         # Combine results
-        all_sources = set(reviews.get("sources", []))
-        if conflicts.get("success"):
-            all_sources.update(conflicts.get("sources", []))
+        all_sources = {}
+        for search in searches:
+            all_sources.update(dict.fromkeys(search.get("sources", [])))
         
         # Combine issues
         all_issues = {}
-        for issue in reviews.get("sentiment", {}).get("common_issues", []):
-            all_issues[issue["issue"]] = all_issues.get(issue["issue"], 0) + issue["mentions"]
-        if conflicts.get("success"):
-            for issue in conflicts.get("sentiment", {}).get("common_issues", []):
+        for search in searches:
+            for issue in search.get("sentiment", {}).get("common_issues", []):
                 all_issues[issue["issue"]] = all_issues.get(issue["issue"], 0) + issue["mentions"]
         
         sorted_issues = sorted(all_issues.items(), key=lambda x: x[1], reverse=True)[:5]
         
+        # Bucket results by what they talk about
+        categories = {category: 0 for category in _CATEGORY_KEYWORDS}
+        for search in searches:
+            for result in search.get("results", []):
+                categories[self._classify_result(result)] += 1
+        
         # Average risk score
-        risk_scores = [reviews.get("google_risk_score", 0)]
-        if conflicts.get("success"):
-            risk_scores.append(conflicts.get("google_risk_score", 0))
+        risk_scores = [search.get("google_risk_score", 0) for search in searches]
         avg_risk = sum(risk_scores) // len(risk_scores)
         
         # Determine severity
@@ -370,9 +527,10 @@ class GoogleSearchService:
             "results_analyzed": reviews.get("results_returned", 0),
             "sources": list(all_sources),
             "common_issues": [{"issue": k, "mentions": v} for k, v in sorted_issues],
+            "categories": categories,
             "sentiment": reviews.get("sentiment", {}).get("overall", "unknown"),
             "recommendation": recommendation,
-            "fetched_at": datetime.utcnow().isoformat()
+            "fetched_at": fetched_at
         }
 
 
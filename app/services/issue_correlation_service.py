@@ -3,53 +3,528 @@ Sherlock - Issue Correlation Service
 Matches detected issues to likely app culprits based on timing
 """
 
-from datetime import datetime, timedelta
-from typing import Dict, List, Any, Optional
-from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, desc, and_
+import asyncio
+from bisect import bisect_right
+from dataclasses import dataclass, field
+from functools import lru_cache
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Any, Final, Literal, Optional, Tuple
+import numpy as np
+from cachetools import TTLCache
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from sqlalchemy import select, desc, and_, func
+from sqlalchemy.orm import load_only, raiseload
 
 from app.db.models import Store, InstalledApp, ThemeIssue, DailyScan
 from app.services.conflict_database import ConflictDatabase
 
 
+# Only the columns correlation/diagnosis actually read - skips hydrating
+# code snippets, notes etc. raiseload guards against silent lazy loads.
+_ISSUE_COLUMNS = (
+    load_only(
+        ThemeIssue.detected_at, ThemeIssue.issue_type, ThemeIssue.file_path,
+        ThemeIssue.severity, ThemeIssue.likely_source, ThemeIssue.confidence
+    ),
+    raiseload("*"),
+)
+_APP_COLUMNS = (
+    load_only(
+        InstalledApp.store_id, InstalledApp.app_name, InstalledApp.installed_on,
+        InstalledApp.update_detected_at, InstalledApp.is_suspect
+    ),
+    raiseload("*"),
+)
+
+
+# Apps installed or updated within this many days are correlation candidates
+RECENT_APP_DAYS = 14
+
+# Days between app install/update and issue detection ->
+# (max gap, confidence, reasoning template). Closer in time = higher confidence.
+GAP_TIERS = (
+    (1, 85, "{action} 1 day before issue appeared"),
+    (3, 70, "{action} {gap} days before issue appeared"),
+    (7, 50, "{action} {gap} days before issue appeared"),
+)
+GAP_DEFAULT = (30, "{action} {gap} days ago")
+
+
+def _gap_tier(gap: int) -> Tuple[int, str]:
+    """(confidence, reasoning template) for a gap in days"""
+    for max_gap, confidence, template in GAP_TIERS:
+        if gap <= max_gap:
+            return confidence, template
+    return GAP_DEFAULT
+
+
+def _suspect_confidence(gap: int, is_suspect: bool) -> int:
+    """Confidence for a gap in days, boosted if the app is flagged as suspect"""
+    confidence, _ = _gap_tier(gap)
+    return min(95, confidence + 15) if is_suspect else confidence
+
+
+def _confidence_matrix(gaps: np.ndarray, suspect: np.ndarray) -> np.ndarray:
+    """Vectorized _suspect_confidence over an (issues, apps) gap matrix"""
+    confidence = np.select(
+        [gaps <= max_gap for max_gap, _, _ in GAP_TIERS],
+        [tier_confidence for _, tier_confidence, _ in GAP_TIERS],
+        default=GAP_DEFAULT[0],
+    )
+    return np.where(suspect[None, :], np.minimum(95, confidence + 15), confidence)
+
+
+def _build_reasoning(gap: int, was_updated: bool, is_suspect: bool) -> str:
+    """Explain why an app installed/updated `gap` days before an issue is a suspect"""
+    _, template = _gap_tier(gap)
+    reasoning = template.format(action="Updated" if was_updated else "Installed", gap=gap)
+    if is_suspect:
+        reasoning += " (flagged as potentially problematic)"
+    # Add note about update being potential cause
+    if was_updated:
+        reasoning += " - app updates can introduce new issues"
+    return reasoning
+
+
+# Reasoning strings for every gap inside the recent-apps window,
+# keyed by (gap, was_updated, is_suspect). Longer gaps are built on demand.
+REASONINGS: Final[Dict[Tuple[int, bool, bool], str]] = {
+    (gap, was_updated, is_suspect): _build_reasoning(gap, was_updated, is_suspect)
+    for gap in range(RECENT_APP_DAYS + 1)
+    for was_updated in (False, True)
+    for is_suspect in (False, True)
+}
+
+# Plain English descriptions of issue types
+ISSUE_DESCRIPTIONS: Final[Dict[str, str]] = {
+    "injected_script": "Unknown code was added to your theme files",
+    "duplicate_code": "The same code appears multiple times, which can slow your store",
+    "conflict": "Two apps are trying to modify the same part of your theme",
+    "error": "There's a code error that could break parts of your store",
+    "css_conflict": "Styling code is conflicting, which may affect how your store looks",
+    "global_css": "An app added styling that could affect your entire store's appearance"
+}
+
+# Confidence score thresholds -> label (bisect over the thresholds)
+CONFIDENCE_THRESHOLDS: Final = (40, 60, 80)
+CONFIDENCE_LABELS: Final = ("Uncertain", "Possibly", "Likely", "Very likely")
+
+# Step-by-step merchant guidance, as (title, description, why) templates
+# filled with str.format_map. Placeholders: {app}, {other_app},
+# {description}, {solution} (conflicts), {suspect_names} (multiple).
+ACTION_TEMPLATES: Final[Dict[str, Tuple[Tuple[str, str, str], ...]]] = {
+    # Primary suspect conflicts with another installed app
+    "conflict": (
+        (
+            "'{app}' may be conflicting with '{other_app}'",
+            "{description}",
+            "These two apps are known to cause issues when used together.",
+        ),
+        (
+            "Try disabling '{app}' first",
+            "Go to your Shopify admin → Apps, find '{app}', and disable it. Check if your store works normally.",
+            "Since '{app}' was installed more recently, it may be the cause.",
+        ),
+        (
+            "If that doesn't fix it, try the other app",
+            "Re-enable '{app}', then disable '{other_app}' instead. Check your store again.",
+            "Sometimes the older app is actually the problem, especially after updates.",
+        ),
+        (
+            "Consider replacing one of them",
+            "{solution}",
+            "Some apps simply can't work together. Choosing one should permanently fix the issue.",
+        ),
+    ),
+    # Primary suspect was recently updated
+    "update": (
+        (
+            "'{app}' was recently updated",
+            "This app received an update around the time your issue started. Updates can sometimes introduce new bugs or conflicts.",
+            "The timing of the update matches when the problem appeared.",
+        ),
+        (
+            "Check if you can roll back the app",
+            "Some apps let you use a previous version. Check '{app}' settings or contact their support.",
+            "Rolling back to the previous version may fix the issue immediately.",
+        ),
+        (
+            "If no rollback, disable temporarily",
+            "Go to your Shopify admin → Apps, find '{app}', and disable it. Check if your store works normally.",
+            "This confirms whether the updated app is causing the problem.",
+        ),
+        (
+            "Contact the app developer",
+            "Let the '{app}' team know about the issue. They may already be working on a fix or can help you troubleshoot.",
+            "App developers want to know about bugs - your report helps everyone!",
+        ),
+    ),
+    # Single app guidance (no known conflict, new install)
+    "single": (
+        (
+            "Disable '{app}' temporarily",
+            "Go to your Shopify admin → Apps, find '{app}', and disable it. This won't delete anything, just turns it off.",
+            "This app may be causing the issue based on when it was installed.",
+        ),
+        (
+            "Check if the problem is fixed",
+            "Open your store in a new browser window (or incognito mode) and check if things are back to normal.",
+            "This helps confirm whether that app was involved.",
+        ),
+        (
+            "If it's NOT fixed, re-enable and try the next suspect",
+            "Turn the app back on, then disable the next most likely app. Repeat until you find the culprit.",
+            "Sometimes our best guess isn't right - systematic testing will find the real cause.",
+        ),
+        (
+            "Decide what to do next",
+            "If disabling '{app}' fixed the issue, you can: keep it disabled, contact the app developer for help, or look for an alternative app.",
+            "You have options - don't feel stuck!",
+        ),
+    ),
+    # Lower confidence - test several suspects
+    "multiple": (
+        (
+            "Test your recently installed apps one by one",
+            "Disable each recent app one at a time, checking your store after each to find the culprit.",
+            "We found a few possible causes, so testing each one will pinpoint the exact issue.",
+        ),
+        (
+            "Start with: {suspect_names}",
+            "These apps were installed around the time issues started appearing.",
+            "Testing in order of likelihood saves you time.",
+        ),
+        (
+            "If none of those fix it",
+            "The issue might be from a theme update or a change you made manually. Check your theme's recent changes in Shopify admin → Online Store → Themes → Actions → Edit code → Older versions.",
+            "Not all issues come from apps - theme updates can also cause problems.",
+        ),
+    ),
+    # No suspects - general guidance
+    "none": (
+        (
+            "Review your recently installed apps",
+            "Check which apps you've added in the last 2 weeks. Try disabling them one at a time.",
+            "Most theme issues are caused by app conflicts.",
+        ),
+        (
+            "Check your theme customizations",
+            "If you recently edited your theme code directly, those changes might be causing issues.",
+            "Manual code changes can sometimes conflict with apps.",
+        ),
+        (
+            "If nothing works",
+            "Try reverting your theme to a previous version: Shopify admin → Online Store → Themes → Actions → Edit code → Older versions.",
+            "This can undo recent changes that may have caused the issue.",
+        ),
+    ),
+}
+
+# Appended after every guidance
+FINAL_ACTION: Final = {
+    "title": "Still stuck? We're here to help",
+    "description": "Run another scan to get fresh data, or contact the app developer directly. You can also reach out to a Shopify Expert if the issue persists.",
+    "why": "Sometimes issues need expert eyes. Don't struggle alone!"
+}
+
+# Rows fetched per round when streaming a store's issues
+ISSUE_BATCH_SIZE = 500
+
+# Above this many (issue, app) pairs the timing math is done with numpy
+VECTORIZE_MIN_PAIRS = 2000
+
+_EPOCH = datetime(1970, 1, 1)
+_EPOCH_UTC = datetime(1970, 1, 1, tzinfo=timezone.utc)
+_MICROSECOND = timedelta(microseconds=1)
+_DAY_MICROS = 86_400_000_000
+
+
+_CONFLICT_DB = ConflictDatabase()
+
+
+@lru_cache(maxsize=512)
+def _cached_check_conflicts(app_names: frozenset) -> Tuple[Dict[str, Any], ...]:
+    """
+    Known conflicts among a set of installed apps. The conflict table is
+    static, so stores with the same app set share one result (treat it as
+    read-only).
+    """
+    return tuple(_CONFLICT_DB.check_conflicts(list(app_names)))
+
+
+@dataclass(slots=True)
+class Correlation:
+    """How strongly one app is linked to a store's issues"""
+    confidence: int
+    reasoning: str
+    installed_on: Optional[datetime] = None
+    updated_on: Optional[datetime] = None
+    was_updated: bool = False
+    issues_caused: List[Dict[str, Any]] = field(default_factory=list)
+
+
+def _is_attributed(issue: ThemeIssue) -> bool:
+    """Whether an issue already has a likely source (other than "Unknown")"""
+    return bool(issue.likely_source) and issue.likely_source.lower() != "unknown"
+
+
+def _app_timing(issue_date: datetime, app: InstalledApp) -> Optional[Tuple[int, bool]]:
+    """
+    (gap in days, was_updated) for an app installed or updated before the
+    issue was detected, or None if it came afterwards
+    """
+    # Check if app was updated recently
+    if app.update_detected_at and app.update_detected_at <= issue_date:
+        # If update is more recent than install, it's likely the cause
+        if not app.installed_on or app.update_detected_at > app.installed_on:
+            return (issue_date - app.update_detected_at).days, True
+    
+    # If not an update, check install date
+    if app.installed_on and app.installed_on <= issue_date:
+        return (issue_date - app.installed_on).days, False
+    
+    return None
+
+
+def _to_micros(values: List[Optional[datetime]]) -> Tuple[np.ndarray, np.ndarray]:
+    """Datetimes -> (int64 microseconds since epoch, mask of non-null values)"""
+    micros = np.zeros(len(values), dtype=np.int64)
+    present = np.zeros(len(values), dtype=bool)
+    for k, dt in enumerate(values):
+        if dt is not None:
+            micros[k] = (dt - (_EPOCH_UTC if dt.tzinfo else _EPOCH)) // _MICROSECOND
+            present[k] = True
+    return micros, present
+
+
+def _timing_matrix(
+    issues: List[ThemeIssue], apps: List[InstalledApp]
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Vectorized _app_timing over every (issue, app) pair.
+    Returns (matched, gap_days, was_updated), each shaped (issues, apps).
+    """
+    issued, _ = _to_micros([issue.detected_at for issue in issues])
+    installed, has_install = _to_micros([app.installed_on for app in apps])
+    updated, has_update = _to_micros([app.update_detected_at for app in apps])
+    
+    issued = issued[:, None]
+    
+    newer_update = has_update & (~has_install | (updated > installed))
+    by_update = newer_update[None, :] & (updated[None, :] <= issued)
+    by_install = has_install[None, :] & (installed[None, :] <= issued) & ~by_update
+    
+    relevant = np.where(by_update, updated[None, :], installed[None, :])
+    gaps = (issued - relevant) // _DAY_MICROS
+    return by_update | by_install, gaps, by_update
+
+
 class IssueCorrelationService:
     """
     Correlates detected issues with recently installed apps
     to help merchants identify the likely cause
     """
     
-    def __init__(self, db: AsyncSession):
+    # Finished diagnoses per (store, detail) -> (fingerprint, diagnosis), reused
+    # for up to 15 minutes while the store's fingerprint (see _get_fingerprints)
+    # is unchanged
+    _diagnosis_cache = TTLCache(maxsize=2048, ttl=15 * 60)
+    
+    def __init__(
+        self, db: AsyncSession, session_factory: Optional[async_sessionmaker] = None
+    ):
+        """
+        session_factory (optional) lets independent reads run concurrently on
+        their own sessions; without it everything runs on db, one at a time
+        """
         self.db = db
+        self.session_factory = session_factory
     
-    async def get_store_diagnosis(self, shop_domain: str) -> Dict[str, Any]:
+    @classmethod
+    def invalidate(cls, store_id: str):
+        """
+        Drop cached diagnoses for a store. Not needed after ORM/Core writes
+        (the fingerprint picks those up) - only for edits made in raw SQL
+        """
+        cls._diagnosis_cache.pop((store_id, "summary"), None)
+        cls._diagnosis_cache.pop((store_id, "full"), None)
+    
+    async def get_store_diagnosis(
+        self, shop_domain: str, detail: Literal["summary", "full"] = "full"
+    ) -> Dict[str, Any]:
         """
         Get a full diagnosis for a store including:
         - Current issues
         - Likely culprits
         - Recommended actions
+        
+        detail="summary" returns only the status, issue count and
+        primary suspect (for badges and frequently polled widgets).
         """
-        # Get store
-        result = await self.db.execute(
-            select(Store).where(Store.shopify_domain == shop_domain)
-        )
-        store = result.scalar_one_or_none()
+        return (await self.get_store_diagnoses([shop_domain], detail))[0]
+    
+    async def get_store_diagnoses(
+        self, shop_domains: List[str], detail: Literal["summary", "full"] = "full"
+    ) -> List[Dict[str, Any]]:
+        """
+        Diagnose several stores at once (dashboards, cron sweeps).
+        Uses the same handful of queries however many shops are passed.
+        Results are returned in the same order as shop_domains.
+        Cached results are shared between callers - treat them as read-only.
+        Timestamps are left as datetimes for the response class to serialize.
+        """
+        # One clock reading for the whole request
+        now = datetime.utcnow()
+        since = now - timedelta(days=RECENT_APP_DAYS)
         
-        if not store:
-            return {
+        # Reuse cached diagnoses for stores whose inputs haven't changed
+        fingerprints = await self._get_fingerprints(shop_domains, since)
+        diagnoses_by_shop = {}
+        for shop_domain, (store_id, _, fingerprint) in fingerprints.items():
+            cached = self._diagnosis_cache.get((store_id, detail))
+            if cached and cached[0] == fingerprint:
+                diagnoses_by_shop[shop_domain] = cached[1]
+        
+        stale = [shop for shop in fingerprints if shop not in diagnoses_by_shop]
+        if stale:
+            last_clean_scans = {
+                store_id: last_clean for store_id, last_clean, _ in fingerprints.values()
+            }
+            diagnoses_by_shop.update(
+                await self._diagnose_stores(stale, since, last_clean_scans, detail)
+            )
+            for shop_domain in stale:
+                store_id, _, fingerprint = fingerprints[shop_domain]
+                self._diagnosis_cache[(store_id, detail)] = (
+                    fingerprint, diagnoses_by_shop[shop_domain]
+                )
+        
+        return [
+            diagnoses_by_shop.get(shop_domain) or {
                 "shop": shop_domain,
                 "status": "unknown",
                 "message": "Store not found"
             }
+            for shop_domain in shop_domains
+        ]
+    
+    async def _get_fingerprints(
+        self, shop_domains: List[str], since: datetime
+    ) -> Dict[str, Tuple[str, Optional[datetime], Tuple]]:
+        """
+        Cheap aggregates that change whenever a store's diagnosis would:
+        {shop_domain: (store_id, last_clean_scan, fingerprint)} for the
+        stores that exist
+        """
+        store_ids = select(Store.id).where(Store.shopify_domain.in_(shop_domains))
+        issues = (
+            select(
+                ThemeIssue.store_id,
+                func.count().label("issues"),
+                func.max(ThemeIssue.detected_at).label("latest_issue"),
+                # Catches in-place edits (attribution, severity, resolution...)
+                func.max(ThemeIssue.updated_at).label("issue_edited"),
+            )
+            .where(ThemeIssue.store_id.in_(store_ids))
+            .where(ThemeIssue.is_resolved == False)
+            .group_by(ThemeIssue.store_id)
+            .subquery()
+        )
+        apps = (
+            select(
+                InstalledApp.store_id,
+                func.count().label("apps"),
+                func.count().filter(InstalledApp.last_activity_at >= since).label("recent_apps"),
+                func.count().filter(InstalledApp.is_suspect == True).label("suspect_apps"),
+                func.max(InstalledApp.last_activity_at).label("latest_app"),
+                func.max(InstalledApp.updated_at).label("app_edited"),
+            )
+            .where(InstalledApp.store_id.in_(store_ids))
+            .group_by(InstalledApp.store_id)
+            .subquery()
+        )
+        clean_scans = (
+            select(DailyScan.store_id, func.max(DailyScan.scan_date).label("last_clean"))
+            .where(DailyScan.store_id.in_(store_ids))
+            .where(DailyScan.risk_level == "low")
+            .where(DailyScan.css_issues_found == 0)
+            .group_by(DailyScan.store_id)
+            .subquery()
+        )
         
-        # Get unresolved issues
-        issues = await self._get_unresolved_issues(store.id)
+        result = await self.db.execute(
+            select(
+                Store.shopify_domain, Store.id,
+                issues.c.issues, issues.c.latest_issue, issues.c.issue_edited,
+                apps.c.apps, apps.c.recent_apps, apps.c.suspect_apps, apps.c.latest_app,
+                apps.c.app_edited,
+                clean_scans.c.last_clean,
+            )
+            .outerjoin(issues, issues.c.store_id == Store.id)
+            .outerjoin(apps, apps.c.store_id == Store.id)
+            .outerjoin(clean_scans, clean_scans.c.store_id == Store.id)
+            .where(Store.shopify_domain.in_(shop_domains))
+        )
+        return {
+            shop_domain: (store_id, fingerprint[-1], tuple(fingerprint))
+            for shop_domain, store_id, *fingerprint in result
+        }
+    
+    async def _diagnose_stores(
+        self,
+        shop_domains: List[str],
+        since: datetime,
+        last_clean_scans: Dict[str, Optional[datetime]],
+        detail: Literal["summary", "full"]
+    ) -> Dict[str, Dict[str, Any]]:
+        """
+        Diagnose existing stores from scratch: {shop_domain: diagnosis}.
+        Last clean scans come from the fingerprint query.
+        """
+        # Get stores and their unresolved issues in one round trip
+        stores = await self._get_stores_with_issues(shop_domains)
+        store_ids = [store_id for store_id, _ in stores.values()]
         
-        # Get recently installed apps (last 14 days)
-        recent_apps = await self._get_recent_apps(store.id, days=14)
+        # All installed apps (for conflict checking) only matter when there are
+        # issues, and summaries don't report conflicts
+        conflict_store_ids = []
+        if detail == "full":
+            conflict_store_ids = [store_id for store_id, issues in stores.values() if issues]
         
-        # Get last clean scan
-        last_clean_scan = await self._get_last_clean_scan(store.id)
+        # The remaining lookups are independent - fetch them concurrently when
+        # there's a session factory (only one of them may use self.db, the
+        # other gets its own session), else one after the other on self.db
+        if self.session_factory is not None:
+            recent_apps, all_app_names = await asyncio.gather(
+                self._in_own_session(self._get_recent_apps, store_ids, since),
+                self._get_all_installed_apps(conflict_store_ids),
+            )
+        else:
+            recent_apps = await self._get_recent_apps(store_ids, since)
+            all_app_names = await self._get_all_installed_apps(conflict_store_ids)
         
+        return {
+            shop_domain: self._diagnose_store(
+                shop_domain,
+                issues,
+                recent_apps.get(store_id, []),
+                last_clean_scans.get(store_id),
+                all_app_names.get(store_id, []),
+                detail
+            )
+            for shop_domain, (store_id, issues) in stores.items()
+        }
+    
+    def _diagnose_store(
+        self,
+        shop_domain: str,
+        issues: List[ThemeIssue],
+        recent_apps: List[InstalledApp],
+        last_clean_scan: Optional[datetime],
+        all_app_names: List[str],
+        detail: Literal["summary", "full"] = "full"
+    ) -> Dict[str, Any]:
+        """Build the diagnosis for one store from its pre-fetched data"""
         # If no issues, store is healthy
         if not issues:
             return {
@@ -58,20 +533,18 @@ class IssueCorrelationService:
                 "message": "No issues detected. Your store is running smoothly.",
                 "issues": [],
                 "suspects": [],
-                "last_clean_scan": last_clean_scan.isoformat() if last_clean_scan else None
+                "last_clean_scan": last_clean_scan
             }
         
-        # Get all installed apps for conflict checking
-        all_apps = await self._get_all_installed_apps(store.id)
-        all_app_names = [app.app_name for app in all_apps]
-        
-        # Check for conflicts between installed apps
-        conflict_db = ConflictDatabase()
-        conflicts = conflict_db.check_conflicts(all_app_names)
-        
         # Correlate issues with apps
         correlations = self._correlate_issues_to_apps(issues, recent_apps, last_clean_scan)
         
+        if detail == "summary":
+            return self._build_summary(shop_domain, issues, correlations, last_clean_scan)
+        
+        # Check for conflicts between installed apps
+        conflicts = list(_cached_check_conflicts(frozenset(all_app_names)))
+        
         # Build merchant-friendly diagnosis
         diagnosis = self._build_diagnosis(issues, correlations, recent_apps, conflicts, all_app_names)
         
@@ -83,184 +556,228 @@ class IssueCorrelationService:
             "primary_suspect": diagnosis["primary_suspect"],
             "all_suspects": diagnosis["all_suspects"],
             "recommended_actions": diagnosis["actions"],
-            "last_clean_scan": last_clean_scan.isoformat() if last_clean_scan else None,
+            "last_clean_scan": last_clean_scan,
             "apps_since_clean": len(recent_apps)
         }
     
-    async def _get_unresolved_issues(self, store_id: str) -> List[ThemeIssue]:
-        """Get all unresolved issues for a store"""
-        result = await self.db.execute(
-            select(ThemeIssue)
-            .where(ThemeIssue.store_id == store_id)
-            .where(ThemeIssue.is_resolved == False)
+    def _build_summary(
+        self,
+        shop_domain: str,
+        issues: List[ThemeIssue],
+        correlations: Dict[str, Correlation],
+        last_clean_scan: Optional[datetime]
+    ) -> Dict[str, Any]:
+        """Status, issue count and top suspect only - no issue/action formatting"""
+        primary_suspect = None
+        if correlations:
+            app_name, data = max(correlations.items(), key=lambda kv: kv[1].confidence)
+            primary_suspect = {
+                "app_name": app_name,
+                "confidence": data.confidence,
+                "confidence_label": self._get_confidence_label(data.confidence),
+            }
+        
+        return {
+            "shop": shop_domain,
+            "status": "issues_found",
+            "issue_count": len(issues),
+            "primary_suspect": primary_suspect,
+            "last_clean_scan": last_clean_scan
+        }
+    
+    async def _in_own_session(self, query, *args):
+        """
+        Run a read helper on a dedicated session.
+        AsyncSession is not safe for concurrent use, so each branch of a
+        gather() needs its own session (and connection).
+        """
+        async with self.session_factory() as db:
+            return await query(*args, db=db)
+    
+    async def _get_stores_with_issues(
+        self, shop_domains: List[str]
+    ) -> Dict[str, Tuple[str, List[ThemeIssue]]]:
+        """
+        Get store id and all unresolved issues per shop domain.
+        Shops that don't exist are left out.
+        """
+        if not shop_domains:
+            return {}
+        
+        # Stream in batches so stores with thousands of historical issues are
+        # hydrated ISSUE_BATCH_SIZE rows at a time instead of one big buffer
+        result = await self.db.stream(
+            select(Store.shopify_domain, Store.id, ThemeIssue)
+            .outerjoin(
+                ThemeIssue,
+                and_(ThemeIssue.store_id == Store.id, ThemeIssue.is_resolved == False)
+            )
+            .where(Store.shopify_domain.in_(shop_domains))
             .order_by(desc(ThemeIssue.detected_at))
+            .options(*_ISSUE_COLUMNS)
+            .execution_options(yield_per=ISSUE_BATCH_SIZE)
         )
-        return result.scalars().all()
+        stores = {}
+        async for shop_domain, store_id, issue in result:
+            _, issues = stores.setdefault(shop_domain, (store_id, []))
+            # A store without unresolved issues comes back as a single (id, None) row
+            if issue is not None:
+                issues.append(issue)
+        
+        return stores
     
-    async def _get_all_installed_apps(self, store_id: str) -> List[InstalledApp]:
-        """Get all installed apps for a store"""
+    async def _get_all_installed_apps(self, store_ids: List[str]) -> Dict[str, List[str]]:
+        """Get the names of all installed apps per store"""
+        if not store_ids:
+            return {}
+        
         result = await self.db.execute(
-            select(InstalledApp)
-            .where(InstalledApp.store_id == store_id)
+            select(InstalledApp.store_id, InstalledApp.app_name)
+            .where(InstalledApp.store_id.in_(store_ids))
         )
-        return result.scalars().all()
+        names_by_store = {}
+        for store_id, app_name in result:
+            names_by_store.setdefault(store_id, []).append(app_name)
+        return names_by_store
 
-    async def _get_recent_apps(self, store_id: str, days: int = 14) -> List[InstalledApp]:
-        """Get apps installed OR updated in the last N days"""
-        since = datetime.utcnow() - timedelta(days=days)
+    async def _get_recent_apps(
+        self, store_ids: List[str], since: datetime, db: Optional[AsyncSession] = None
+    ) -> Dict[str, List[InstalledApp]]:
+        """Get apps installed OR updated since the given time, per store"""
+        if not store_ids:
+            return {}
         
-        # Get apps installed recently
-        installed_result = await self.db.execute(
-            select(InstalledApp)
-            .where(InstalledApp.store_id == store_id)
-            .where(InstalledApp.installed_on >= since)
-        )
-        installed_apps = installed_result.scalars().all()
+        db = db or self.db
         
-        # Get apps updated recently
-        updated_result = await self.db.execute(
+        # Apps installed OR updated recently, newest activity first
+        result = await db.execute(
             select(InstalledApp)
-            .where(InstalledApp.store_id == store_id)
-            .where(InstalledApp.update_detected_at >= since)
+            .where(InstalledApp.store_id.in_(store_ids))
+            .where(InstalledApp.last_activity_at >= since)
+            .order_by(desc(InstalledApp.last_activity_at))
+            .options(*_APP_COLUMNS)
         )
-        updated_apps = updated_result.scalars().all()
-        
-        # Combine and deduplicate
-        all_apps = {app.id: app for app in installed_apps}
-        for app in updated_apps:
-            if app.id not in all_apps:
-                all_apps[app.id] = app
         
-        # Sort by most recent activity (install or update)
-        def get_latest_date(app):
-            dates = [d for d in [app.installed_on, app.update_detected_at] if d]
-            return max(dates) if dates else datetime.min
-        
-        return sorted(all_apps.values(), key=get_latest_date, reverse=True)
-    
-    async def _get_last_clean_scan(self, store_id: str) -> Optional[datetime]:
-        """Get the date of the last scan with no issues"""
-        result = await self.db.execute(
-            select(DailyScan)
-            .where(DailyScan.store_id == store_id)
-            .where(DailyScan.risk_level == "low")
-            .where(DailyScan.css_issues_found == 0)
-            .order_by(desc(DailyScan.scan_date))
-            .limit(1)
-        )
-        scan = result.scalar_one_or_none()
-        return scan.scan_date if scan else None
+        apps_by_store = {}
+        for app in result.scalars():
+            apps_by_store.setdefault(app.store_id, []).append(app)
+        return apps_by_store
     
     def _correlate_issues_to_apps(
         self, 
         issues: List[ThemeIssue], 
         apps: List[InstalledApp],
         last_clean: Optional[datetime]
-    ) -> Dict[str, Dict]:
+    ) -> Dict[str, Correlation]:
         """
         Match issues to apps based on timing
-        Returns dict of app_name -> {confidence, issues_caused, reasoning}
+        Returns dict of app_name -> Correlation
         """
+        # Issues that already name their source never need the app matching
+        attributed = [_is_attributed(issue) for issue in issues]
+        unattributed = [issue for issue, known in zip(issues, attributed) if not known]
+        match_apps = bool(apps and unattributed)
+        
+        # Nothing to match against and nothing already attributed
+        if not match_apps and not any(attributed):
+            return {}
+        
         correlations = {}
         
-        for issue in issues:
+        # For big stores do the date arithmetic for all pairs in one numpy pass
+        matrix = None
+        if match_apps and len(unattributed) * len(apps) >= VECTORIZE_MIN_PAIRS:
+            matrix = matched, gaps, updated = _timing_matrix(unattributed, apps)
+            confidences = _confidence_matrix(
+                gaps, np.array([bool(app.is_suspect) for app in apps], dtype=bool)
+            )
+        elif match_apps:
+            # Apps sorted by the earliest date they can be blamed for an issue:
+            # their install date, or update date if the install date is unknown
+            active_from = sorted(
+                (app.installed_on or app.update_detected_at, j)
+                for j, app in enumerate(apps)
+                if app.installed_on or app.update_detected_at
+            )
+            active_dates = [date for date, _ in active_from]
+            # Issues from the same scan share a cutoff - order each prefix once
+            candidates_by_cutoff = {}
+            cutoff, previous_date = len(active_dates), None
+        
+        # Walk issues in their original order so suspects keep a stable order;
+        # row indexes the unattributed issues
+        row = -1
+        for issue, known in zip(issues, attributed):
             issue_date = issue.detected_at
             
             # If issue already has attribution, use it (but skip "Unknown")
-            if issue.likely_source and issue.likely_source.lower() != "unknown":
-                app_name = issue.likely_source
-                if app_name not in correlations:
-                    correlations[app_name] = {
-                        "confidence": issue.confidence or 50,
-                        "issues_caused": [],
-                        "reasoning": "Previously identified as likely source",
-                        "installed_on": None,
-                        "updated_on": None,
-                        "was_updated": False
-                    }
-                correlations[app_name]["issues_caused"].append({
+            if known:
+                record = correlations.get(issue.likely_source)
+                if record is None:
+                    record = correlations[issue.likely_source] = Correlation(
+                        confidence=issue.confidence or 50,
+                        reasoning="Previously identified as likely source"
+                    )
+                record.issues_caused.append({
                     "type": issue.issue_type,
                     "file": issue.file_path,
                     "severity": issue.severity
                 })
                 continue
             
+            if not match_apps:
+                continue
+            row += 1
+            
             # Otherwise, look for apps installed or updated before issue was detected
-            for app in apps:
-                # Determine if this was an install or update
-                was_updated = False
-                relevant_date = None
-                
-                # Check if app was updated recently
-                if app.update_detected_at and app.update_detected_at <= issue_date:
-                    # If update is more recent than install, it's likely the cause
-                    if not app.installed_on or app.update_detected_at > app.installed_on:
-                        was_updated = True
-                        relevant_date = app.update_detected_at
-                
-                # If not an update, check install date
-                if not relevant_date and app.installed_on and app.installed_on <= issue_date:
-                    relevant_date = app.installed_on
-                
-                if not relevant_date:
-                    continue
-                
-                # Calculate time gap
-                gap = (issue_date - relevant_date).days
-                
-                # Closer in time = higher confidence
-                if gap <= 1:
-                    confidence = 85
-                    if was_updated:
-                        reasoning = "Updated 1 day before issue appeared"
-                    else:
-                        reasoning = "Installed 1 day before issue appeared"
-                elif gap <= 3:
-                    confidence = 70
-                    if was_updated:
-                        reasoning = f"Updated {gap} days before issue appeared"
-                    else:
-                        reasoning = f"Installed {gap} days before issue appeared"
-                elif gap <= 7:
-                    confidence = 50
-                    if was_updated:
-                        reasoning = f"Updated {gap} days before issue appeared"
-                    else:
-                        reasoning = f"Installed {gap} days before issue appeared"
+            if matrix is not None:
+                timings = (
+                    (apps[j], int(gaps[row, j]), bool(updated[row, j]), int(confidences[row, j]))
+                    for j in np.flatnonzero(matched[row])
+                )
+            else:
+                # Only apps active before the issue can match (kept in input order).
+                # Issues arrive newest first, so the cutoff usually just walks back.
+                if previous_date is not None and issue_date <= previous_date:
+                    while cutoff and active_dates[cutoff - 1] > issue_date:
+                        cutoff -= 1
                 else:
-                    confidence = 30
-                    if was_updated:
-                        reasoning = f"Updated {gap} days ago"
-                    else:
-                        reasoning = f"Installed {gap} days ago"
-                
-                # Boost confidence if app is flagged as suspect
-                if app.is_suspect:
-                    confidence = min(95, confidence + 15)
-                    reasoning += " (flagged as potentially problematic)"
-                
-                # Add note about update being potential cause
-                if was_updated:
-                    reasoning += " - app updates can introduce new issues"
+                    cutoff = bisect_right(active_dates, issue_date)
+                previous_date = issue_date
+                candidates = candidates_by_cutoff.get(cutoff)
+                if candidates is None:
+                    candidates = candidates_by_cutoff[cutoff] = sorted(
+                        j for _, j in active_from[:cutoff]
+                    )
+                timings = (
+                    (apps[j], gap, was_updated, _suspect_confidence(gap, bool(apps[j].is_suspect)))
+                    for j in candidates
+                    for gap, was_updated in (_app_timing(issue_date, apps[j]),)
+                )
+            
+            # Closer in time = higher confidence, boosted for suspect apps
+            for app, gap, was_updated, confidence in timings:
+                is_suspect = bool(app.is_suspect)
+                reasoning = REASONINGS.get((gap, was_updated, is_suspect))
+                if reasoning is None:
+                    reasoning = _build_reasoning(gap, was_updated, is_suspect)
                 
-                app_name = app.app_name
-                if app_name not in correlations:
-                    correlations[app_name] = {
-                        "confidence": confidence,
-                        "issues_caused": [],
-                        "reasoning": reasoning,
-                        "installed_on": app.installed_on.isoformat() if app.installed_on else None,
-                        "updated_on": app.update_detected_at.isoformat() if app.update_detected_at else None,
-                        "was_updated": was_updated
-                    }
-                else:
+                record = correlations.get(app.app_name)
+                if record is None:
+                    record = correlations[app.app_name] = Correlation(
+                        confidence=confidence,
+                        reasoning=reasoning,
+                        installed_on=app.installed_on,
+                        updated_on=app.update_detected_at,
+                        was_updated=was_updated
+                    )
+                elif confidence > record.confidence:
                     # Update confidence if this correlation is stronger
-                    if confidence > correlations[app_name]["confidence"]:
-                        correlations[app_name]["confidence"] = confidence
-                        correlations[app_name]["reasoning"] = reasoning
-                        correlations[app_name]["was_updated"] = was_updated
+                    record.confidence = confidence
+                    record.reasoning = reasoning
+                    record.was_updated = was_updated
                 
-                correlations[app_name]["issues_caused"].append({
+                record.issues_caused.append({
                     "type": issue.issue_type,
                     "file": issue.file_path,
                     "severity": issue.severity
@@ -271,7 +788,7 @@ class IssueCorrelationService:
     def _build_diagnosis(
         self, 
         issues: List[ThemeIssue], 
-        correlations: Dict[str, Dict],
+        correlations: Dict[str, Correlation],
         recent_apps: List[InstalledApp],
         conflicts: List[Dict] = None,
         all_app_names: List[str] = None
@@ -282,34 +799,38 @@ class IssueCorrelationService:
         all_app_names = all_app_names or []
         
         # Format issues for display
-        formatted_issues = []
-        for issue in issues:
-            formatted_issues.append({
+        formatted_issues = [
+            {
                 "type": issue.issue_type,
                 "severity": issue.severity,
                 "file": issue.file_path,
                 "description": self._get_issue_description(issue),
-                "detected_at": issue.detected_at.isoformat() if issue.detected_at else None
-            })
-        
-        # Sort suspects by confidence
-        suspects = []
-        for app_name, data in correlations.items():
-            # Check if this app has conflicts with other installed apps
-            app_conflicts = self._get_app_conflicts(app_name, conflicts)
-            
-            suspects.append({
-                "app_name": app_name,
-                "confidence": data["confidence"],
-                "confidence_label": self._get_confidence_label(data["confidence"]),
-                "reasoning": data["reasoning"],
-                "issues_caused": len(data["issues_caused"]),
-                "installed_on": data["installed_on"],
-                "was_updated": data.get("was_updated", False),
-                "conflicts_with": app_conflicts
-            })
+                "detected_at": issue.detected_at
+            }
+            for issue in issues
+        ]
         
-        suspects.sort(key=lambda x: x["confidence"], reverse=True)
+        # Sort suspects by confidence, noting conflicts with other installed apps
+        conflict_index, conflicting_lower = self._index_conflicts(conflicts)
+        suspects = sorted(
+            (
+                {
+                    "app_name": app_name,
+                    "confidence": data.confidence,
+                    "confidence_label": self._get_confidence_label(data.confidence),
+                    "reasoning": data.reasoning,
+                    "issues_caused": len(data.issues_caused),
+                    "installed_on": data.installed_on,
+                    "was_updated": data.was_updated,
+                    "conflicts_with": self._get_app_conflicts(
+                        app_name.lower(), conflicts, conflict_index, conflicting_lower
+                    )
+                }
+                for app_name, data in correlations.items()
+            ),
+            key=lambda x: x["confidence"],
+            reverse=True
+        )
         
         # Determine primary suspect
         primary_suspect = None
@@ -335,51 +856,68 @@ class IssueCorrelationService:
             "conflicts": conflicts
         }
     
-    def _get_app_conflicts(self, app_name: str, conflicts: List[Dict]) -> List[Dict]:
-        """Get conflicts involving this specific app"""
+    @staticmethod
+    def _index_conflicts(
+        conflicts: List[Dict]
+    ) -> Tuple[Dict[str, List[int]], List[List[Tuple[str, str]]]]:
+        """
+        Lowercase every app name in the conflicts once:
+        (matched name -> conflict positions, per-conflict (name, lowercased) pairs)
+        """
+        index = {}
+        conflicting_lower = []
+        for position, conflict in enumerate(conflicts):
+            for name in {a.lower() for a in conflict.get("matched_apps", [])}:
+                index.setdefault(name, []).append(position)
+            conflicting_lower.append(
+                [(a, a.lower()) for a in conflict.get("conflicting_apps", [])]
+            )
+        return index, conflicting_lower
+    
+    @staticmethod
+    def _get_app_conflicts(
+        app_lower: str,
+        conflicts: List[Dict],
+        conflict_index: Dict[str, List[int]],
+        conflicting_lower: List[List[Tuple[str, str]]]
+    ) -> List[Dict]:
+        """Get conflicts involving this specific app (name already lowercased)"""
         app_conflicts = []
-        app_lower = app_name.lower()
-        
-        for conflict in conflicts:
-            matched = [a.lower() for a in conflict.get("matched_apps", [])]
-            if app_lower in matched or any(app_lower in m for m in matched):
-                # Find the OTHER app in the conflict
-                other_apps = [a for a in conflict.get("conflicting_apps", []) 
-                             if a.lower() != app_lower and app_lower not in a.lower()]
-                if other_apps:
-                    app_conflicts.append({
-                        "other_app": other_apps[0],
-                        "severity": conflict.get("severity"),
-                        "description": conflict.get("description"),
-                        "solution": conflict.get("solution")
-                    })
+        
+        # The app may be named exactly or as part of a longer matched name
+        positions = {
+            position
+            for name, named_in in conflict_index.items() if app_lower in name
+            for position in named_in
+        }
+        
+        for position in sorted(positions):
+            conflict = conflicts[position]
+            # Find the OTHER app in the conflict
+            other_apps = [a for a, a_lower in conflicting_lower[position]
+                          if a_lower != app_lower and app_lower not in a_lower]
+            if other_apps:
+                app_conflicts.append({
+                    "other_app": other_apps[0],
+                    "severity": conflict.get("severity"),
+                    "description": conflict.get("description"),
+                    "solution": conflict.get("solution")
+                })
         
         return app_conflicts
     
-    def _get_issue_description(self, issue: ThemeIssue) -> str:
+    @staticmethod
+    def _get_issue_description(issue: ThemeIssue) -> str:
         """Get plain English description of an issue"""
-        descriptions = {
-            "injected_script": "Unknown code was added to your theme files",
-            "duplicate_code": "The same code appears multiple times, which can slow your store",
-            "conflict": "Two apps are trying to modify the same part of your theme",
-            "error": "There's a code error that could break parts of your store",
-            "css_conflict": "Styling code is conflicting, which may affect how your store looks",
-            "global_css": "An app added styling that could affect your entire store's appearance"
-        }
-        return descriptions.get(issue.issue_type, f"A {issue.issue_type} issue was detected")
+        return ISSUE_DESCRIPTIONS.get(issue.issue_type, f"A {issue.issue_type} issue was detected")
     
-    def _get_confidence_label(self, confidence: float) -> str:
+    @staticmethod
+    def _get_confidence_label(confidence: float) -> str:
         """Convert confidence score to plain English"""
-        if confidence >= 80:
-            return "Very likely"
-        elif confidence >= 60:
-            return "Likely"
-        elif confidence >= 40:
-            return "Possibly"
-        else:
-            return "Uncertain"
+        return CONFIDENCE_LABELS[bisect_right(CONFIDENCE_THRESHOLDS, confidence)]
     
-    def _get_suspect_message(self, suspect: Dict) -> str:
+    @staticmethod
+    def _get_suspect_message(suspect: Dict) -> str:
         """Build a clear message about the suspected app"""
         confidence = suspect["confidence"]
         app = suspect["app_name"]
@@ -393,149 +931,48 @@ class IssueCorrelationService:
         else:
             return f"'{app}' could possibly be related, but we're not certain."
     
+    @staticmethod
     def _build_actions(
-        self, 
         primary: Optional[Dict], 
         suspects: List[Dict], 
         issues: List[ThemeIssue],
         conflicts: List[Dict] = None
     ) -> List[Dict]:
         """Build step-by-step actions for the merchant"""
-        actions = []
-        conflicts = conflicts or []
+        context = {}
         
         if primary and primary["confidence"] >= 60:
+            context["app"] = primary["app_name"]
             # Check if there's a conflict with another app
             if primary.get("conflicts_with"):
                 conflict = primary["conflicts_with"][0]
-                other_app = conflict["other_app"]
-                
-                # Conflict-based guidance
-                actions.append({
-                    "step": 1,
-                    "title": f"'{primary['app_name']}' may be conflicting with '{other_app}'",
-                    "description": f"{conflict['description']}",
-                    "why": "These two apps are known to cause issues when used together."
-                })
-                actions.append({
-                    "step": 2,
-                    "title": f"Try disabling '{primary['app_name']}' first",
-                    "description": f"Go to your Shopify admin → Apps, find '{primary['app_name']}', and disable it. Check if your store works normally.",
-                    "why": f"Since '{primary['app_name']}' was installed more recently, it may be the cause."
-                })
-                actions.append({
-                    "step": 3,
-                    "title": "If that doesn't fix it, try the other app",
-                    "description": f"Re-enable '{primary['app_name']}', then disable '{other_app}' instead. Check your store again.",
-                    "why": "Sometimes the older app is actually the problem, especially after updates."
-                })
-                actions.append({
-                    "step": 4,
-                    "title": "Consider replacing one of them",
-                    "description": f"{conflict.get('solution', 'You may need to choose one app over the other.')}",
-                    "why": "Some apps simply can't work together. Choosing one should permanently fix the issue."
-                })
+                context["other_app"] = conflict["other_app"]
+                context["description"] = f"{conflict['description']}"
+                context["solution"] = f"{conflict.get('solution', 'You may need to choose one app over the other.')}"
+                guidance = "conflict"
             elif primary.get("was_updated", False):
-                # Update-specific guidance
-                actions.append({
-                    "step": 1,
-                    "title": f"'{primary['app_name']}' was recently updated",
-                    "description": "This app received an update around the time your issue started. Updates can sometimes introduce new bugs or conflicts.",
-                    "why": "The timing of the update matches when the problem appeared."
-                })
-                actions.append({
-                    "step": 2,
-                    "title": "Check if you can roll back the app",
-                    "description": f"Some apps let you use a previous version. Check '{primary['app_name']}' settings or contact their support.",
-                    "why": "Rolling back to the previous version may fix the issue immediately."
-                })
-                actions.append({
-                    "step": 3,
-                    "title": "If no rollback, disable temporarily",
-                    "description": f"Go to your Shopify admin → Apps, find '{primary['app_name']}', and disable it. Check if your store works normally.",
-                    "why": "This confirms whether the updated app is causing the problem."
-                })
-                actions.append({
-                    "step": 4,
-                    "title": "Contact the app developer",
-                    "description": f"Let the '{primary['app_name']}' team know about the issue. They may already be working on a fix or can help you troubleshoot.",
-                    "why": "App developers want to know about bugs - your report helps everyone!"
-                })
+                guidance = "update"
             else:
-                # Single app guidance (no known conflict, new install)
-                actions.append({
-                    "step": 1,
-                    "title": f"Disable '{primary['app_name']}' temporarily",
-                    "description": f"Go to your Shopify admin → Apps, find '{primary['app_name']}', and disable it. This won't delete anything, just turns it off.",
-                    "why": f"This app may be causing the issue based on when it was installed."
-                })
-                actions.append({
-                    "step": 2,
-                    "title": "Check if the problem is fixed",
-                    "description": "Open your store in a new browser window (or incognito mode) and check if things are back to normal.",
-                    "why": "This helps confirm whether that app was involved."
-                })
-                actions.append({
-                    "step": 3,
-                    "title": "If it's NOT fixed, re-enable and try the next suspect",
-                    "description": "Turn the app back on, then disable the next most likely app. Repeat until you find the culprit.",
-                    "why": "Sometimes our best guess isn't right - systematic testing will find the real cause."
-                })
-                actions.append({
-                    "step": 4,
-                    "title": "Decide what to do next",
-                    "description": f"If disabling '{primary['app_name']}' fixed the issue, you can: keep it disabled, contact the app developer for help, or look for an alternative app.",
-                    "why": "You have options - don't feel stuck!"
-                })
+                guidance = "single"
         elif suspects:
             # Lower confidence - suggest testing multiple
-            actions.append({
-                "step": 1,
-                "title": "Test your recently installed apps one by one",
-                "description": "Disable each recent app one at a time, checking your store after each to find the culprit.",
-                "why": "We found a few possible causes, so testing each one will pinpoint the exact issue."
-            })
-            suspect_names = [s["app_name"] for s in suspects[:3]]
-            actions.append({
-                "step": 2,
-                "title": f"Start with: {', '.join(suspect_names)}",
-                "description": "These apps were installed around the time issues started appearing.",
-                "why": "Testing in order of likelihood saves you time."
-            })
-            actions.append({
-                "step": 3,
-                "title": "If none of those fix it",
-                "description": "The issue might be from a theme update or a change you made manually. Check your theme's recent changes in Shopify admin → Online Store → Themes → Actions → Edit code → Older versions.",
-                "why": "Not all issues come from apps - theme updates can also cause problems."
-            })
+            context["suspect_names"] = ", ".join(s["app_name"] for s in suspects[:3])
+            guidance = "multiple"
         else:
-            # No suspects - general guidance
-            actions.append({
-                "step": 1,
-                "title": "Review your recently installed apps",
-                "description": "Check which apps you've added in the last 2 weeks. Try disabling them one at a time.",
-                "why": "Most theme issues are caused by app conflicts."
-            })
-            actions.append({
-                "step": 2,
-                "title": "Check your theme customizations",
-                "description": "If you recently edited your theme code directly, those changes might be causing issues.",
-                "why": "Manual code changes can sometimes conflict with apps."
-            })
-            actions.append({
-                "step": 3,
-                "title": "If nothing works",
-                "description": "Try reverting your theme to a previous version: Shopify admin → Online Store → Themes → Actions → Edit code → Older versions.",
-                "why": "This can undo recent changes that may have caused the issue."
-            })
+            guidance = "none"
+        
+        actions = [
+            {
+                "step": step,
+                "title": title.format_map(context),
+                "description": description.format_map(context),
+                "why": why.format_map(context),
+            }
+            for step, (title, description, why) in enumerate(ACTION_TEMPLATES[guidance], 1)
+        ]
         
         # Always add this final action
-        actions.append({
-            "step": len(actions) + 1,
-            "title": "Still stuck? We're here to help",
-            "description": "Run another scan to get fresh data, or contact the app developer directly. You can also reach out to a Shopify Expert if the issue persists.",
-            "why": "Sometimes issues need expert eyes. Don't struggle alone!"
-        })
+        actions.append({"step": len(actions) + 1, **FINAL_ACTION})
         
         return actions
 
@@ -3,24 +3,343 @@ Sherlock - Orphan Code Detection Service
 Finds leftover code from uninstalled apps that may still cause issues
 """
 
+import asyncio
+import bisect
 import re
+import threading
 from datetime import datetime
-from typing import Optional, List, Dict, Any
+from functools import lru_cache, partial
+from itertools import accumulate, count, islice
+from typing import Optional, List, Dict, Any, AsyncIterator, Callable, Tuple
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
+from sqlalchemy import select, insert
 import httpx
+import logging
+import numpy as np
+from cachetools import LRUCache
+
+try:
+    import re2
+except ImportError:  # optional - linear-time matching, falls back to re
+    re2 = None
+
+try:
+    import hyperscan
+except ImportError:  # optional - SIMD multi-pattern prefilter
+    hyperscan = None
+
+try:
+    import ahocorasick
+except ImportError:  # optional - without it every relevant pattern is run
+    ahocorasick = None
 
 from app.db.models import Store, InstalledApp, ThemeIssue
 from app.services.conflict_database import ConflictDatabase, ORPHAN_CODE_PATTERNS
 
+logger = logging.getLogger(__name__)
+
+
+# Concurrent asset requests per theme fetch (fits Shopify's 40-request REST burst)
+ASSET_FETCH_CONCURRENCY = 8
+
+# Total characters of theme asset content kept between scans (per process)
+ASSET_CACHE_MAX_CHARS = 32 * 1024 * 1024
+
+
+def _compile(pattern: str, as_bytes: bool = False):
+    """
+    Case-insensitive regex, compiled with RE2 when available (no backtracking
+    blowups on large theme files), else with re. Patterns RE2 can't handle
+    (lookaround, backreferences) fall back to re. as_bytes compiles a regex
+    for scanning encoded content.
+    """
+    if re2 is not None:
+        try:
+            return re2.compile(f"(?i){pattern}".encode() if as_bytes else f"(?i){pattern}")
+        except re2.error:
+            pass
+    return re.compile(pattern.encode() if as_bytes else pattern, re.IGNORECASE)
+
+
+def _any_of(patterns: List[str]):
+    """Case-insensitive alternation matching wherever any of the patterns would"""
+    return _compile("|".join(f"(?:{pattern})" for pattern in patterns))
+
+
+# One combined regex per app, and one across every app - a single pass tells
+# whether a file can contain the app's (or any app's) patterns at all
+APP_MATCHERS = [_any_of(pattern_data["patterns"]) for pattern_data in ORPHAN_CODE_PATTERNS]
+ANY_APP_MATCHER = _any_of(
+    [pattern for pattern_data in ORPHAN_CODE_PATTERNS for pattern in pattern_data["patterns"]]
+)
+
+# Files at least this big get their line index built with numpy
+NUMPY_LINE_INDEX_MIN_SIZE = 64 * 1024
+
+# Shortest literal worth prefiltering on
+MIN_LITERAL_LENGTH = 3
+
+
+def _required_literal(pattern: str) -> Optional[str]:
+    """
+    Lowercased literal prefix that every match of the pattern starts with,
+    or None if there isn't a usable one (alternation, short prefix)
+    """
+    if re.search(r"(?<!\\)\|", pattern):
+        return None
+    
+    literal = ""
+    i = 0
+    while i < len(pattern):
+        char = pattern[i]
+        if char == "\\" and i + 1 < len(pattern) and not pattern[i + 1].isalnum():
+            literal += pattern[i + 1]
+            i += 2
+            continue
+        if char in ".^$*+?{}[]()|\\":
+            # ?, * and {0,..} can make the preceding character optional
+            if char in "?*{":
+                literal = literal[:-1]
+            break
+        literal += char
+        i += 1
+    
+    return literal.lower() if len(literal) >= MIN_LITERAL_LENGTH else None
+
+
+# (pattern id, pattern, compiled regex, bytes regex, required literal) per app,
+# in ORPHAN_CODE_PATTERNS order; ids are positions in the flattened pattern list
+_ALL_PATTERNS = [pattern for pattern_data in ORPHAN_CODE_PATTERNS for pattern in pattern_data["patterns"]]
+_pattern_ids = count()
+APP_PATTERNS = [
+    [
+        (
+            next(_pattern_ids),
+            pattern,
+            _compile(pattern),
+            _compile(pattern, as_bytes=True),
+            _required_literal(pattern),
+        )
+        for pattern in pattern_data["patterns"]
+    ]
+    for pattern_data in ORPHAN_CODE_PATTERNS
+]
+
+# Aho-Corasick automaton over every literal: one pass per file finds which
+# literals (and so which patterns) can possibly match
+LITERAL_AUTOMATON = None
+if ahocorasick is not None:
+    LITERAL_AUTOMATON = ahocorasick.Automaton()
+    for literal in {literal for patterns in APP_PATTERNS for *_, literal in patterns if literal}:
+        LITERAL_AUTOMATON.add_word(literal, literal)
+    LITERAL_AUTOMATON.make_automaton()
+
+# Hyperscan database over every pattern: one SIMD pass per file reports
+# which patterns occur at all, so finditer only runs for those
+HYPERSCAN_DB = None
+if hyperscan is not None:
+    try:
+        HYPERSCAN_DB = hyperscan.Database()
+        HYPERSCAN_DB.compile(
+            expressions=[pattern.encode() for pattern in _ALL_PATTERNS],
+            ids=list(range(len(_ALL_PATTERNS))),
+            elements=len(_ALL_PATTERNS),
+            flags=[hyperscan.HS_FLAG_CASELESS | hyperscan.HS_FLAG_SINGLEMATCH] * len(_ALL_PATTERNS),
+        )
+    except hyperscan.error:
+        HYPERSCAN_DB = None
+
+
+# App indexes by the file path fragments they apply to, e.g. "snippets/"
+APPS_BY_FILE_FILTER = {
+    file_filter: [
+        app_index
+        for app_index, pattern_data in enumerate(ORPHAN_CODE_PATTERNS)
+        if file_filter in pattern_data["files"]
+    ]
+    for file_filter in {f for pattern_data in ORPHAN_CODE_PATTERNS for f in pattern_data["files"]}
+}
+
+
+@lru_cache(maxsize=4096)
+def _relevant_apps(file_path: str) -> Tuple[int, ...]:
+    """Indexes of the apps whose code can live in this file, in ORPHAN_CODE_PATTERNS order"""
+    return tuple(sorted({
+        app_index
+        for file_filter, app_indexes in APPS_BY_FILE_FILTER.items()
+        if file_filter in file_path
+        for app_index in app_indexes
+    }))
+
+
+# Hyperscan scratch space can't be shared between concurrent scans - one per thread
+_hyperscan_local = threading.local()
+
+
+def _hyperscan_scratch():
+    if not hasattr(_hyperscan_local, "scratch"):
+        _hyperscan_local.scratch = hyperscan.Scratch(HYPERSCAN_DB)
+    return _hyperscan_local.scratch
+
+
+def _on_hyperscan_match(pattern_id, start, end, flags, patterns_found):
+    patterns_found.add(pattern_id)
+
+
+def _line_number_lookup(lines: List[str], content_bytes: Optional[bytes]) -> Callable[[int], int]:
+    """
+    Function mapping a character offset to its 1-based line number. Large
+    ASCII files find their newlines with numpy instead of walking every line.
+    """
+    if content_bytes is not None and len(content_bytes) >= NUMPY_LINE_INDEX_MIN_SIZE:
+        newlines = np.flatnonzero(np.frombuffer(content_bytes, dtype=np.uint8) == ord("\n"))
+        return lambda offset: int(newlines.searchsorted(offset)) + 1
+    
+    # line_starts[i] is the offset where line i + 1 begins
+    line_starts = list(accumulate((len(line) + 1 for line in lines[:-1]), initial=0))
+    return partial(bisect.bisect_right, line_starts)
+
+
+def _scan_file(file_path: str, content: str, apps_installed: List[bool]) -> List[List[Dict[str, Any]]]:
+    """Orphan-code findings in one theme file, as one list per app in ORPHAN_CODE_PATTERNS order"""
+    findings_by_app = [[] for _ in ORPHAN_CODE_PATTERNS]
+    seen = set()  # (app, line_number) already reported
+    
+    # Only check relevant files
+    relevant_apps = _relevant_apps(file_path)
+    if not relevant_apps:
+        return findings_by_app
+    
+    # Prefilters and bytes-mode regexes only run on ASCII content,
+    # where IGNORECASE matching is plain ASCII case folding and byte
+    # offsets are character offsets
+    is_ascii = content.isascii()
+    content_bytes = content.encode("ascii") if is_ascii else None
+    patterns_found = None
+    literals_found = None
+    content_lower = None
+    
+    if HYPERSCAN_DB is not None and is_ascii:
+        # Pattern ids occurring anywhere in the file
+        patterns_found = set()
+        HYPERSCAN_DB.scan(
+            content_bytes,
+            match_event_handler=_on_hyperscan_match,
+            context=patterns_found,
+            scratch=_hyperscan_scratch(),
+        )
+        if not patterns_found:
+            return findings_by_app
+    else:
+        # Most files contain nothing from any known app
+        if not ANY_APP_MATCHER.search(content):
+            return findings_by_app
+        
+        # Literals present in the file - in one automaton pass when
+        # available, else checked one by one against the lowered text
+        if is_ascii:
+            content_lower = content.lower()
+            if LITERAL_AUTOMATON is not None:
+                literals_found = {
+                    literal for _, literal in LITERAL_AUTOMATON.iter(content_lower)
+                }
+    
+    # Split once per file, with a lookup from match offset to line number
+    lines = content.split("\n")
+    line_number = _line_number_lookup(lines, content_bytes)
+    
+    # Check the orphan patterns of each app that applies to this file
+    for app_index in relevant_apps:
+        pattern_data = ORPHAN_CODE_PATTERNS[app_index]
+        if patterns_found is None and not APP_MATCHERS[app_index].search(content):
+            continue
+        
+        app_is_installed = apps_installed[app_index]
+        app_findings = findings_by_app[app_index]
+        
+        for pattern_id, _, regex, bytes_regex, literal in APP_PATTERNS[app_index]:
+            if patterns_found is not None and pattern_id not in patterns_found:
+                continue
+            if literal and literals_found is not None:
+                if literal not in literals_found:
+                    continue
+            elif literal and content_lower is not None and literal not in content_lower:
+                continue
+            
+            if content_bytes is not None:
+                match_iter = bytes_regex.finditer(content_bytes)
+            else:
+                match_iter = regex.finditer(content)
+            
+            for match in islice(match_iter, 3):  # Limit to 3 examples per pattern, stop scanning there
+                line_num = line_number(match.start())
+                
+                # Only add unique findings
+                key = (pattern_data["app"], line_num)
+                if key in seen:
+                    continue
+                seen.add(key)
+                
+                # Get context (the line containing the match)
+                context_start = max(0, line_num - 1)
+                context_end = min(len(lines), line_num + 2)
+                snippet = "\n".join(lines[context_start:context_end])
+                
+                finding = {
+                    "app": pattern_data["app"],
+                    "app_installed": app_is_installed,
+                    "is_orphan": not app_is_installed,
+                    "file_path": file_path,
+                    "line_number": line_num,
+                    "pattern_id": pattern_id,
+                    "code_snippet": snippet[:300],
+                    "cleanup_guide": pattern_data["cleanup_guide"],
+                }
+                app_findings.append(finding)
+    
+    return findings_by_app
+
 
 class OrphanCodeService:
     """Service for detecting leftover code from uninstalled apps"""
     
+    # Shared across instances so Shopify connections (HTTP/2, one per shop)
+    # and their TLS handshakes are reused between scans
+    _client: Optional[httpx.AsyncClient] = None
+    
+    # Asset content by (store_id, theme_id, asset key) -> (checksum or updated_at, value),
+    # so unchanged theme files aren't downloaded again on the next scan. Bounded
+    # by total content size, least recently used assets evicted first
+    _asset_cache = LRUCache(maxsize=ASSET_CACHE_MAX_CHARS, getsizeof=lambda entry: len(entry[1]))
+    
     def __init__(self, db: AsyncSession):
         self.db = db
         self.conflict_db = ConflictDatabase()
     
+    @classmethod
+    async def _get_client(cls) -> httpx.AsyncClient:
+        """Get or create the shared HTTP/2 client"""
+        if cls._client is None:
+            cls._client = httpx.AsyncClient(
+                http2=True,
+                limits=httpx.Limits(max_keepalive_connections=ASSET_FETCH_CONCURRENCY),
+            )
+        return cls._client
+    
+    @classmethod
+    async def close(cls):
+        """Close the shared HTTP client"""
+        if cls._client:
+            await cls._client.aclose()
+            cls._client = None
+    
+    @classmethod
+    def _cache_asset(cls, cache_key: tuple, version: str, value: str):
+        """Remember an asset's content (the cache evicts least recently used when full)"""
+        if len(value) > cls._asset_cache.maxsize:
+            return
+        cls._asset_cache[cache_key] = (version, value)
+    
     async def scan_for_orphan_code(self, store: Store) -> Dict[str, Any]:
         """
         Scan theme files for orphan code from uninstalled apps
@@ -29,7 +348,7 @@ class OrphanCodeService:
         but may not be currently active, leaving behind dead code that
         slows down the store or causes conflicts.
         """
-        print(f"🔍 [OrphanCode] Scanning for leftover code in {store.shopify_domain}")
+        logger.info("🔍 [OrphanCode] Scanning for leftover code in %s", store.shopify_domain)
         
         empty_result = {
             "success": True,
@@ -37,13 +356,14 @@ class OrphanCodeService:
             "uninstalled_apps_with_leftover_code": 0,
             "orphan_code_by_app": [],
             "orphan_findings": [],
+            "patterns": {},
             "active_app_code_detected": 0,
             "files_scanned": 0,
             "recommendations": [],
         }
         
         if not store.access_token:
-            print(f"⚠️ [OrphanCode] No access token for {store.shopify_domain}")
+            logger.warning("⚠️ [OrphanCode] No access token for %s", store.shopify_domain)
             return empty_result
         
         try:
@@ -53,88 +373,59 @@ class OrphanCodeService:
             )
             installed_apps = [app.app_name.lower() for app in result.scalars().all()]
         except Exception as e:
-            print(f"⚠️ [OrphanCode] Error fetching installed apps: {e}")
+            logger.warning("⚠️ [OrphanCode] Error fetching installed apps: %s", e)
             installed_apps = []
         
-        # Fetch theme files
-        theme_files = await self._fetch_theme_files(store)
+        # Findings per app (in ORPHAN_CODE_PATTERNS order), scanning file by file
+        findings_by_app = [[] for _ in ORPHAN_CODE_PATTERNS]
+        
+        # Skip if app is currently installed (not orphan)
+        apps_installed = [
+            any(pattern_data["app"].lower() in installed for installed in installed_apps)
+            for pattern_data in ORPHAN_CODE_PATTERNS
+        ]
         
-        if not theme_files:
-            print(f"⚠️ [OrphanCode] No theme files retrieved for {store.shopify_domain}")
+        # Files are independent: scan each in a worker thread (RE2 and Hyperscan
+        # release the GIL while matching) as soon as it's downloaded, so only
+        # files in flight are held in memory. Merged per app in fetch order.
+        scans = {}
+        async for position, file_path, content in self._iter_theme_files(store):
+            scans[position] = asyncio.ensure_future(
+                asyncio.to_thread(_scan_file, file_path, content, apps_installed)
+            )
+        
+        if not scans:
+            logger.warning("⚠️ [OrphanCode] No theme files retrieved for %s", store.shopify_domain)
             return empty_result
         
-        orphan_findings = []
+        for position in sorted(scans):
+            for app_findings, found in zip(findings_by_app, await scans[position]):
+                app_findings.extend(found)
         
-        # Check each app's orphan patterns
-        for pattern_data in ORPHAN_CODE_PATTERNS:
-            app_name = pattern_data["app"].lower()
-            
-            # Skip if app is currently installed (not orphan)
-            app_is_installed = any(app_name in installed for installed in installed_apps)
-            
-            # Scan files for patterns
-            for file_path, content in theme_files.items():
-                # Only check relevant files
-                relevant_file = any(
-                    f in file_path for f in pattern_data["files"]
-                )
-                
-                if not relevant_file:
-                    continue
-                
-                for pattern in pattern_data["patterns"]:
-                    matches = list(re.finditer(pattern, content, re.IGNORECASE))
-                    
-                    if matches:
-                        # Found pattern!
-                        for match in matches[:3]:  # Limit to 3 examples per pattern
-                            line_num = content[:match.start()].count("\n") + 1
-                            
-                            # Get context (the line containing the match)
-                            lines = content.split("\n")
-                            context_start = max(0, line_num - 1)
-                            context_end = min(len(lines), line_num + 2)
-                            snippet = "\n".join(lines[context_start:context_end])
-                            
-                            finding = {
-                                "app": pattern_data["app"],
-                                "app_installed": app_is_installed,
-                                "is_orphan": not app_is_installed,
-                                "file_path": file_path,
-                                "line_number": line_num,
-                                "pattern_matched": pattern,
-                                "code_snippet": snippet[:300],
-                                "cleanup_guide": pattern_data["cleanup_guide"],
-                            }
-                            
-                            # Only add unique findings
-                            if not any(
-                                f["file_path"] == file_path and 
-                                f["app"] == pattern_data["app"] and
-                                f["line_number"] == line_num
-                                for f in orphan_findings
-                            ):
-                                orphan_findings.append(finding)
+        orphan_findings = [finding for app_findings in findings_by_app for finding in app_findings]
         
         # Filter to only orphan code (from uninstalled apps)
         orphan_only = [f for f in orphan_findings if f["is_orphan"]]
         active_app_code = [f for f in orphan_findings if not f["is_orphan"]]
         
-        # Store orphan issues in database
-        for finding in orphan_only:
-            issue = ThemeIssue(
-                store_id=store.id,
-                file_path=finding["file_path"],
-                issue_type="orphan_code",
-                severity="medium",
-                line_number=finding["line_number"],
-                code_snippet=finding["code_snippet"],
-                likely_source=f"{finding['app']} (uninstalled)",
-                confidence=85.0
+        # Store orphan issues in database (one executemany INSERT)
+        if orphan_only:
+            await self.db.execute(
+                insert(ThemeIssue),
+                [
+                    {
+                        "store_id": store.id,
+                        "file_path": finding["file_path"],
+                        "issue_type": "orphan_code",
+                        "severity": "medium",
+                        "line_number": finding["line_number"],
+                        "code_snippet": finding["code_snippet"],
+                        "likely_source": f"{finding['app']} (uninstalled)",
+                        "confidence": 85.0,
+                    }
+                    for finding in orphan_only
+                ],
             )
-            self.db.add(issue)
-        
-        await self.db.flush()
         
         # Group findings by app
         orphan_by_app = {}
@@ -143,18 +434,21 @@ class OrphanCodeService:
             if app not in orphan_by_app:
                 orphan_by_app[app] = {
                     "app": app,
-                    "files_affected": [],
+                    "files_affected": set(),
                     "total_occurrences": 0,
                     "cleanup_guide": finding["cleanup_guide"],
                 }
-            orphan_by_app[app]["files_affected"].append(finding["file_path"])
+            orphan_by_app[app]["files_affected"].add(finding["file_path"])
             orphan_by_app[app]["total_occurrences"] += 1
         
-        # Dedupe files
+        # Sorted so responses (and the files to check) are stable between scans
         for app_data in orphan_by_app.values():
-            app_data["files_affected"] = list(set(app_data["files_affected"]))
+            app_data["files_affected"] = sorted(app_data["files_affected"])
         
-        print(f"✅ [OrphanCode] Found {len(orphan_only)} orphan code instances from {len(orphan_by_app)} uninstalled apps")
+        logger.info(
+            "✅ [OrphanCode] Found %d orphan code instances from %d uninstalled apps",
+            len(orphan_only), len(orphan_by_app),
+        )
         
         return {
             "success": True,
@@ -162,72 +456,93 @@ class OrphanCodeService:
             "uninstalled_apps_with_leftover_code": len(orphan_by_app),
             "orphan_code_by_app": list(orphan_by_app.values()),
             "orphan_findings": orphan_only,  # Detailed findings with code snippets
+            # Regex behind each finding's pattern_id, listed once rather than per finding
+            "patterns": {f["pattern_id"]: _ALL_PATTERNS[f["pattern_id"]] for f in orphan_only},
             "active_app_code_detected": len(active_app_code),
-            "files_scanned": len(theme_files),
+            "files_scanned": len(scans),
             "recommendations": self._generate_orphan_recommendations(orphan_by_app),
         }
     
-    async def _fetch_theme_files(self, store: Store) -> Dict[str, str]:
-        """Fetch theme files that commonly contain app code"""
-        files = {}
+    async def _iter_theme_files(self, store: Store) -> AsyncIterator[Tuple[int, str, str]]:
+        """
+        Fetch theme files that commonly contain app code, yielding
+        (position in fetch order, key, content) as each download completes
+        """
+        fetches = []
         
         try:
-            async with httpx.AsyncClient() as client:
-                # Get active theme
-                response = await client.get(
-                    f"https://{store.shopify_domain}/admin/api/2024-01/themes.json",
-                    headers={
-                        "X-Shopify-Access-Token": store.access_token,
-                        "Content-Type": "application/json"
-                    },
-                    timeout=30.0
-                )
-                
-                if response.status_code != 200:
-                    return {}
-                
-                themes = response.json().get("themes", [])
-                theme_id = None
-                for theme in themes:
-                    if theme.get("role") == "main":
-                        theme_id = str(theme.get("id"))
-                        break
-                
-                if not theme_id:
-                    return {}
-                
-                # Fetch asset list
-                response = await client.get(
-                    f"https://{store.shopify_domain}/admin/api/2024-01/themes/{theme_id}/assets.json",
-                    headers={
-                        "X-Shopify-Access-Token": store.access_token,
-                        "Content-Type": "application/json"
-                    },
-                    timeout=30.0
-                )
-                
-                if response.status_code != 200:
-                    return {}
-                
-                assets = response.json().get("assets", [])
-                
-                # Files to check for orphan code
-                target_files = [
-                    "layout/theme.liquid",
-                    "layout/checkout.liquid",
-                    "config/settings_data.json",
-                ]
-                
-                # Also check snippets and sections
-                for asset in assets:
-                    key = asset.get("key", "")
-                    if key.startswith("snippets/") or key.startswith("sections/"):
-                        target_files.append(key)
-                    if key.startswith("templates/") and key.endswith(".liquid"):
-                        target_files.append(key)
+            client = await self._get_client()
+            
+            # Get active theme
+            response = await client.get(
+                f"https://{store.shopify_domain}/admin/api/2024-01/themes.json",
+                headers={
+                    "X-Shopify-Access-Token": store.access_token,
+                    "Content-Type": "application/json"
+                },
+                timeout=30.0
+            )
+            
+            if response.status_code != 200:
+                return
+            
+            themes = response.json().get("themes", [])
+            theme_id = None
+            for theme in themes:
+                if theme.get("role") == "main":
+                    theme_id = str(theme.get("id"))
+                    break
+            
+            if not theme_id:
+                return
+            
+            # Fetch asset list
+            response = await client.get(
+                f"https://{store.shopify_domain}/admin/api/2024-01/themes/{theme_id}/assets.json",
+                headers={
+                    "X-Shopify-Access-Token": store.access_token,
+                    "Content-Type": "application/json"
+                },
+                timeout=30.0
+            )
+            
+            if response.status_code != 200:
+                return
+            
+            assets = response.json().get("assets", [])
+            
+            # Current version of each asset, to reuse cached content
+            versions = {
+                asset.get("key"): asset.get("checksum") or asset.get("updated_at")
+                for asset in assets
+            }
+            
+            # Files to check for orphan code: the main layouts and settings, then
+            # snippets, sections and liquid templates (deduped, in listing order)
+            target_files = list(dict.fromkeys([
+                "layout/theme.liquid",
+                "layout/checkout.liquid",
+                "config/settings_data.json",
+                *(
+                    key for key in versions
+                    if key and (
+                        key.startswith(("snippets/", "sections/"))
+                        or (key.startswith("templates/") and key.endswith(".liquid"))
+                    )
+                ),
+            ]))
+            
+            # Fetch the files concurrently, a few requests at a time
+            semaphore = asyncio.Semaphore(ASSET_FETCH_CONCURRENCY)
+            
+            async def fetch_one(position: int, key: str) -> Tuple[int, str, Optional[str]]:
+                version = versions.get(key)
+                cache_key = (store.id, theme_id, key)
+                cached = self._asset_cache.get(cache_key)
+                if version and cached and cached[0] == version:
+                    return position, key, cached[1]
                 
-                # Fetch each file
-                for key in target_files[:50]:  # Limit to 50 files
+                async with semaphore:
                     try:
                         response = await client.get(
                             f"https://{store.shopify_domain}/admin/api/2024-01/themes/{theme_id}/assets.json",
@@ -241,17 +556,29 @@ class OrphanCodeService:
                         
                         if response.status_code == 200:
                             asset = response.json().get("asset", {})
-                            content = asset.get("value")
-                            if content:
-                                files[key] = content
-                    except:
-                        continue
-                
-                return files
-                
+                            value = asset.get("value")
+                            if version and value:
+                                self._cache_asset(cache_key, version, value)
+                            return position, key, value
+                    except (httpx.HTTPError, ValueError):
+                        pass
+                    return position, key, None
+            
+            fetches = [
+                asyncio.ensure_future(fetch_one(position, key))
+                for position, key in enumerate(target_files[:50])  # Limit to 50 files
+            ]
+            
+            for fetch in asyncio.as_completed(fetches):
+                position, key, content = await fetch
+                if content:
+                    yield position, key, content
+            
         except Exception as e:
-            print(f"❌ [OrphanCode] Error fetching theme: {e}")
-            return {}
+            logger.error("❌ [OrphanCode] Error fetching theme: %s", e)
+        finally:
+            for fetch in fetches:
+                fetch.cancel()
     
     def _generate_orphan_recommendations(self, orphan_by_app: Dict) -> List[Dict[str, Any]]:
         """Generate recommendations for cleaning up orphan code"""
@@ -6,9 +6,11 @@ Fetches public data from r/shopify and r/ecommerce for app issues
 import asyncio
 import httpx
 from typing import Optional
-from datetime import datetime, timedelta
+from datetime import datetime
 import logging
 
+from cachetools import TTLCache
+
 logger = logging.getLogger(__name__)
 
 
@@ -21,12 +23,16 @@ class RedditService:
     # Subreddits to search
     SUBREDDITS = ["shopify", "ecommerce", "shopifydev"]
     
-    # Cache to avoid hitting rate limits
-    _cache = {}
-    _cache_ttl = timedelta(minutes=15)
+    # Cache to avoid hitting rate limits - search results for 15 minutes,
+    # expired/oldest entries evicted as new ones come in
+    _cache = TTLCache(maxsize=512, ttl=15 * 60)
+    
+    # Searches in flight at once (each holds its slot through the rate-limit pause)
+    MAX_CONCURRENT_SEARCHES = 4
     
     def __init__(self):
         self.client = None
+        self._semaphore = asyncio.Semaphore(self.MAX_CONCURRENT_SEARCHES)
     
     async def _get_client(self) -> httpx.AsyncClient:
         """Get or create HTTP client"""
@@ -48,13 +54,6 @@ class RedditService:
         """Generate cache key"""
         return f"{subreddit}:{query.lower()}"
     
-    def _is_cache_valid(self, cache_key: str) -> bool:
-        """Check if cache entry is still valid"""
-        if cache_key not in self._cache:
-            return False
-        cached_time, _ = self._cache[cache_key]
-        return datetime.now() - cached_time < self._cache_ttl
-    
     async def search_app_issues(
         self,
         app_name: str,
@@ -74,17 +73,24 @@ class RedditService:
         """
         all_posts = []
         
-        for subreddit in self.SUBREDDITS:
-            try:
-                posts = await self._search_subreddit(
+        # Subreddits are searched concurrently, results kept in SUBREDDITS order
+        results = await asyncio.gather(
+            *(
+                self._search_subreddit(
                     subreddit=subreddit,
                     query=f"{app_name} (issue OR problem OR bug OR slow OR conflict)",
                     limit=limit,
                     time_filter=time_filter
                 )
+                for subreddit in self.SUBREDDITS
+            ),
+            return_exceptions=True
+        )
+        for subreddit, posts in zip(self.SUBREDDITS, results):
+            if isinstance(posts, Exception):
+                logger.warning(f"Error searching r/{subreddit}: {posts}")
+            else:
                 all_posts.extend(posts)
-            except Exception as e:
-                logger.warning(f"Error searching r/{subreddit}: {e}")
         
         # Analyze the posts
         analysis = self._analyze_posts(all_posts, app_name)
@@ -110,9 +116,9 @@ class RedditService:
         cache_key = self._get_cache_key(query, subreddit)
         
         # Check cache
-        if self._is_cache_valid(cache_key):
-            _, cached_data = self._cache[cache_key]
-            return cached_data
+        cached = self._cache.get(cache_key)
+        if cached is not None:
+            return cached
         
         client = await self._get_client()
         
@@ -125,40 +131,41 @@ class RedditService:
             "limit": limit
         }
         
-        try:
-            response = await client.get(url, params=params)
-            response.raise_for_status()
-            data = response.json()
-            
-            posts = []
-            for child in data.get("data", {}).get("children", []):
-                post_data = child.get("data", {})
-                posts.append({
-                    "id": post_data.get("id"),
-                    "title": post_data.get("title"),
-                    "subreddit": subreddit,
-                    "score": post_data.get("score", 0),
-                    "num_comments": post_data.get("num_comments", 0),
-                    "created_utc": post_data.get("created_utc"),
-                    "url": f"https://reddit.com{post_data.get('permalink', '')}",
-                    "selftext": post_data.get("selftext", "")[:500],  # First 500 chars
-                    "author": post_data.get("author"),
-                })
-            
-            # Cache the results
-            self._cache[cache_key] = (datetime.now(), posts)
-            
-            # Rate limiting - be nice to Reddit
-            await asyncio.sleep(1)
-            
-            return posts
-            
-        except httpx.HTTPStatusError as e:
-            logger.error(f"Reddit API error: {e.response.status_code}")
-            return []
-        except Exception as e:
-            logger.error(f"Reddit search error: {e}")
-            return []
+        async with self._semaphore:
+            try:
+                response = await client.get(url, params=params)
+                response.raise_for_status()
+                data = response.json()
+                
+                posts = []
+                for child in data.get("data", {}).get("children", []):
+                    post_data = child.get("data", {})
+                    posts.append({
+                        "id": post_data.get("id"),
+                        "title": post_data.get("title"),
+                        "subreddit": subreddit,
+                        "score": post_data.get("score", 0),
+                        "num_comments": post_data.get("num_comments", 0),
+                        "created_utc": post_data.get("created_utc"),
+                        "url": f"https://reddit.com{post_data.get('permalink', '')}",
+                        "selftext": post_data.get("selftext", "")[:500],  # First 500 chars
+                        "author": post_data.get("author"),
+                    })
+                
+                # Cache the results
+                self._cache[cache_key] = posts
+                
+                # Rate limiting - be nice to Reddit
+                await asyncio.sleep(1)
+                
+                return posts
+                
+            except httpx.HTTPStatusError as e:
+                logger.error(f"Reddit API error: {e.response.status_code}")
+                return []
+            except Exception as e:
+                logger.error(f"Reddit search error: {e}")
+                return []
     
     def _analyze_posts(self, posts: list, app_name: str) -> dict:
         """Analyze posts to extract insights"""
@@ -267,35 +274,16 @@ class RedditService:
             "shopify app broke",
         ]
         
-        for query in queries:
-            try:
-                url = f"{self.BASE_URL}/r/shopify/search.json"
-                params = {
-                    "q": query,
-                    "restrict_sr": "1",
-                    "sort": "new",
-                    "t": "month",
-                    "limit": 10
-                }
-                
-                response = await client.get(url, params=params)
-                response.raise_for_status()
-                data = response.json()
-                
-                for child in data.get("data", {}).get("children", []):
-                    post_data = child.get("data", {})
-                    all_posts.append({
-                        "title": post_data.get("title"),
-                        "score": post_data.get("score", 0),
-                        "num_comments": post_data.get("num_comments", 0),
-                        "created_utc": post_data.get("created_utc"),
-                        "url": f"https://reddit.com{post_data.get('permalink', '')}",
-                    })
-                
-                await asyncio.sleep(1)  # Rate limiting
-                
-            except Exception as e:
-                logger.warning(f"Error fetching trending: {e}")
+        # Queries are fetched concurrently, results kept in query order
+        results = await asyncio.gather(
+            *(self._fetch_trending(client, query) for query in queries),
+            return_exceptions=True
+        )
+        for posts in results:
+            if isinstance(posts, Exception):
+                logger.warning(f"Error fetching trending: {posts}")
+            else:
+                all_posts.extend(posts)
         
         # Sort by engagement and recency
         all_posts.sort(key=lambda x: x.get("score", 0) + x.get("num_comments", 0), reverse=True)
@@ -313,6 +301,37 @@ class RedditService:
             "fetched_at": datetime.now().isoformat()
         }
     
+    async def _fetch_trending(self, client: httpx.AsyncClient, query: str) -> list:
+        """Fetch recent r/shopify posts for one trending-issues query"""
+        url = f"{self.BASE_URL}/r/shopify/search.json"
+        params = {
+            "q": query,
+            "restrict_sr": "1",
+            "sort": "new",
+            "t": "month",
+            "limit": 10
+        }
+        
+        async with self._semaphore:
+            response = await client.get(url, params=params)
+            response.raise_for_status()
+            data = response.json()
+            
+            posts = []
+            for child in data.get("data", {}).get("children", []):
+                post_data = child.get("data", {})
+                posts.append({
+                    "title": post_data.get("title"),
+                    "score": post_data.get("score", 0),
+                    "num_comments": post_data.get("num_comments", 0),
+                    "created_utc": post_data.get("created_utc"),
+                    "url": f"https://reddit.com{post_data.get('permalink', '')}",
+                })
+            
+            await asyncio.sleep(1)  # Rate limiting
+            
+            return posts
+    
     async def check_app_reputation(self, app_name: str) -> dict:
         """
         Quick reputation check for an app
@@ -12,8 +12,8 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, update, func
 from uuid import uuid4
 
-from app.services.reddit_service import RedditService
-from app.services.google_search_service import GoogleSearchService
+from app.services.reddit_service import reddit_service
+from app.services.google_search_service import google_search_service
 from app.db.wp_models import WPPluginSignature, WPScanSubmission, WPPluginEvent
 
 
@@ -29,8 +29,9 @@ class WPIntelService:
 
     def __init__(self, db: AsyncSession):
         self.db = db
-        self.reddit_service = RedditService()
-        self.google_service = GoogleSearchService()
+        # Shared singletons - their HTTP clients are closed at app shutdown
+        self.reddit_service = reddit_service
+        self.google_service = google_search_service
 
     async def get_plugin_intel(self, plugin_slug: str) -> Dict[str, Any]:
         """
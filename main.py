@@ -9,7 +9,7 @@ from fastapi.staticfiles import StaticFiles
 from fastapi.responses import HTMLResponse, FileResponse
 from pydantic import BaseModel
 from contextlib import asynccontextmanager
-from typing import Optional, List
+from typing import Literal, Optional, List
 from datetime import datetime
 import asyncio
 
@@ -28,6 +28,7 @@ from app.services.app_scanner_service import AppScannerService
 from app.services.theme_analyzer_service import ThemeAnalyzerService
 from app.services.performance_service import PerformanceService
 from app.api import api_router
+from app.api.responses import ORJSONResponse
 
 
 # Global scheduler instance
@@ -307,6 +308,11 @@ async def lifespan(app: FastAPI):
     
     # Shutdown
     scheduler.shutdown()
+    from app.services.google_search_service import google_search_service
+    await google_search_service.close()
+    from app.services.reddit_service import reddit_service
+    await reddit_service.close()
+    await OrphanCodeService.close()
     print("👋 Shutting down Sherlock...")
 
 
@@ -317,6 +323,7 @@ app = FastAPI(
     version="1.0.0",
     docs_url="/docs",
     redoc_url="/redoc",
+    default_response_class=ORJSONResponse,
     lifespan=lifespan
 )
 
@@ -1826,17 +1833,23 @@ async def deregister_store(payload: ShopRedactRequest, db: AsyncSession = Depend
         raise HTTPException(status_code=500, detail="Error deregistering store")
 
 @app.get("/api/v1/scan/store-diagnosis/{shop}")
-async def get_store_diagnosis(shop: str, db: AsyncSession = Depends(get_db)):
+async def get_store_diagnosis(
+    shop: str,
+    detail: Literal["summary", "full"] = "full",
+    db: AsyncSession = Depends(get_db)
+):
     """
     Get full diagnosis for a store.
     Identifies issues, correlates with recent apps, and provides actions.
+    Pass detail=summary for just the status, issue count and top suspect.
     """
     from app.services.issue_correlation_service import IssueCorrelationService
     
     service = IssueCorrelationService(db)
-    diagnosis = await service.get_store_diagnosis(shop)
+    diagnosis = await service.get_store_diagnosis(shop, detail)
     
-    return diagnosis
+    # Returned directly so orjson serializes the datetimes (skips jsonable_encoder)
+    return ORJSONResponse(diagnosis)
 
 
 @app.get("/api/v1/scan/clear-issues/{shop}")